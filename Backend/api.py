@@ -1,18 +1,47 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Request, Response, Body
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
-from sqlmodel import Field, SQLModel, Relationship, create_engine, Session, select
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from sqlmodel import Field, SQLModel, Relationship, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import Column, DateTime, Index, Integer, LargeBinary
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import create_async_engine
+import asyncpg
 import asyncio
+import bisect
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+import time
 import traceback
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from starlette.websockets import WebSocketDisconnect, WebSocketState
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 
 class ParkingCoordinate(SQLModel, table=True):
     __tablename__ = "parking_coordinates"
+    # Citirile folosesc parking_spots.polygon; indexul mai serveste doar stergerile per parcare si verificarea FK
+    __table_args__ = (Index("ix_parking_coordinates_parking_order", "parking_number", "point_order"),)
     
     coord_id: Optional[int] = Field(default=None, primary_key=True)
     latitude: float
@@ -36,9 +65,58 @@ class ParkingSpot(SQLModel, table=True):
     has_disabled_access: Optional[bool] = True
     has_ev_charging: Optional[bool] = True
 
+    # Copie denormalizata a coordonatelor (migrations/003), ca citirile sa nu mai faca join + agregare.
+    # parking_coordinates ramane sursa; polygon se scrie odata cu ele la create/import.
+    polygon: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))
+    bbox_min_lat: Optional[float] = None
+    bbox_min_lon: Optional[float] = None
+    bbox_max_lat: Optional[float] = None
+    bbox_max_lon: Optional[float] = None
+    centroid_lat: Optional[float] = None
+    centroid_lon: Optional[float] = None
+    # Momentul capturii pentru citirea aplicata pe starea live (migrations/005)
+    detected_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+
     coordinates: List["ParkingCoordinate"] = Relationship(back_populates="spot")
 
 
+class OccupancySample(SQLModel, table=True):
+    __tablename__ = "occupancy_samples"
+    __table_args__ = (Index("ix_occupancy_samples_parking_time", "parking_number", "recorded_at"),)
+
+    sample_id: Optional[int] = Field(default=None, primary_key=True)
+    parking_number: int = Field(foreign_key="parking_spots.parking_number")
+    recorded_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+    empty_spots: int
+    occupied_spots: int
+    total_spots: int
+
+
+class OccupancyRollup(SQLModel, table=True):
+    __tablename__ = "occupancy_rollups"
+
+    parking_number: int = Field(foreign_key="parking_spots.parking_number", primary_key=True)
+    bucket_size: str = Field(primary_key=True)
+    bucket_start: datetime = Field(sa_column=Column(DateTime(timezone=True), primary_key=True))
+    sample_count: int
+    min_occupied: int
+    max_occupied: int
+    sum_occupied: int
+    total_spots: int
+    occupied_seconds: float = 0
+    covered_seconds: float = 0
+
+
+class Zone(SQLModel, table=True):
+    __tablename__ = "zones"
+
+    zone_id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+    # Exact unul din doua: lista explicita de parcari sau poligon (format POLYGON_POINT)
+    parking_numbers: Optional[List[int]] = Field(default=None, sa_column=Column(ARRAY(Integer)))
+    polygon: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))
+
+
 
 class CoordinateRead(SQLModel):
     latitude: float
@@ -78,6 +156,11 @@ class ParkingSpotCreate(SQLModel):
     has_disabled_access: Optional[bool] = True
     has_ev_charging: Optional[bool] = True
 
+class ZoneCreate(SQLModel):
+    name: str
+    parking_numbers: Optional[List[int]] = None
+    coordinates: Optional[List[ParkingCoordinateIn]] = None
+
 class ParkingSpotUpdate(BaseModel):
     parking_number: int | None = None
     name: Optional[str] = None
@@ -91,36 +174,222 @@ class DetectionData(BaseModel):
     parking_number: int
     free_spots: int
     total_spots: int
+    # Momentul capturii la camera (epoch sau ISO 8601); lipsa = momentul primirii
+    detected_at: Optional[datetime] = None
 
 
-DATABASE_URL = "postgresql://postgres:d@localhost:5432/smart_park"
-engine = create_engine(DATABASE_URL, echo=True)
+DB_SETTINGS = {
+    "database": os.getenv("DB_NAME", "smart_park"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", "d"),
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": os.getenv("DB_PORT", "5432"),
+}
+DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
 
+DATABASE_URL = "postgresql+asyncpg://{user}:{password}@{host}:{port}/{database}".format(**DB_SETTINGS)
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=os.getenv("DB_ECHO") == "1",
+    pool_size=DB_POOL_MIN,
+    max_overflow=DB_POOL_MAX - DB_POOL_MIN,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    connect_args={"ssl": DB_SSLMODE},
+)
 
-def get_session():
-    with Session(engine) as session:
+
+async def get_session():
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
 
 
 
-app = FastAPI()
-active_connections: List[WebSocket] = []
-@app.websocket("/ws/parking")
+BROADCAST_FALLBACK_INTERVAL = 5
+
+parking_subscribers: List[WebSocket] = []
+latest_parking_snapshot: Optional["Frame"] = None
+
+# Modul "delta": snapshot complet la conectare, apoi doar loturile cu numarul de locuri schimbat
+DELTA_FIELDS = ["parking_number", "empty_spots", "occupied_spots"]
+delta_subscribers: Dict[WebSocket, Optional[int]] = {}
+parking_version = int(time.time() * 1000)
+parking_rows: Dict[int, dict] = {}
+latest_delta_snapshot: Optional["Frame"] = None
+
+# Codificarea negociata la conectare (?encoding=json|msgpack|binary&compress=deflate), per client
+ws_formats: Dict[WebSocket, Tuple[str, bool]] = {}
+
+# Abonamente pe loturi (mesaj "subscribe" cu lista de parking_number sau bbox): fiecare client primeste
+# doar loturile lui. Indexul invers lot -> clienti face ca fan-out-ul sa coste cat schimbarile relevante.
+SUBSCRIPTION_MAX_LOTS = int(os.getenv("SUBSCRIPTION_MAX_LOTS", "5000"))
+lot_subscriptions: Dict[WebSocket, dict] = {}
+lot_subscribers: Dict[int, Set[WebSocket]] = {}
+# Clientii care au nevoie de un snapshot filtrat (abonare noua, bbox schimbat sau schimbare structurala)
+unsynced_lot_subscribers: Set[WebSocket] = set()
+parking_changed: Optional[asyncio.Event] = None
+broadcast_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global parking_changed, broadcast_loop, history_flush_requested, db_pool
+    broadcast_loop = asyncio.get_running_loop()
+    parking_changed = asyncio.Event()
+    history_flush_requested = asyncio.Event()
+    broadcaster_task = asyncio.create_task(parking_broadcaster())
+    history_task = asyncio.create_task(occupancy_history_flusher())
+    spatial_task = asyncio.create_task(load_spatial_index())
+    zones_task = asyncio.create_task(load_zone_counters())
+    await pubsub.start()
+    yield
+    await pubsub.stop()
+    broadcaster_task.cancel()
+    history_task.cancel()
+    spatial_task.cancel()
+    zones_task.cancel()
+    try:
+        await flush_occupancy_history()
+    except Exception as e:
+        print(f"Eroare la salvarea istoricului la oprire: {e}")
+    if db_pool is not None:
+        await db_pool.close()
+        db_pool = None
+    await engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+RELAY_QUEUE_SIZE = int(os.getenv("RELAY_QUEUE_SIZE", "32"))
+# "drop_oldest": la coada plina aruncam cel mai vechi mesaj si il pastram pe cel nou;
+# "disconnect": clientul lent e deconectat (se poate reconecta si reia de la zi)
+RELAY_SLOW_CONSUMER_POLICY = os.getenv("RELAY_SLOW_CONSUMER_POLICY", "drop_oldest")
+RELAY_SEND_TIMEOUT = float(os.getenv("RELAY_SEND_TIMEOUT", "10"))
+
+
+class CoalescedSlot:
+    # Locul din coada al unui mesaj care se poate inlocui; continutul e citit abia la trimitere
+    def __init__(self, key: str):
+        self.key = key
+
+
+class BroadcastHub:
+    # Fiecare client are coada lui si un task care scrie din ea; publish()/send() doar pun in cozi,
+    # deci un client lent nu mai intarzie pe ceilalti. Mesajele sunt text sau Frame (codificat per client).
+    # Politica la coada plina se poate schimba per client (set_policy). send(..., coalesce=cheie) tine
+    # cel mult un mesaj cu acea cheie in coada: unul nou il inlocuieste pe cel inca netrimis.
+    # on_drop se apeleaza cand hub-ul renunta singur la un client (lent sau trimitere esuata).
+    def __init__(self, name: str, queue_size: int, policy: str, send_timeout: float,
+                 on_drop: Optional[Callable[[WebSocket], None]] = None):
+        self.name = name
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.on_drop = on_drop
+        self.queues: Dict[WebSocket, asyncio.Queue] = {}
+        self.writers: Dict[WebSocket, asyncio.Task] = {}
+        self.policies: Dict[WebSocket, str] = {}
+        self.coalesced: Dict[WebSocket, Dict[str, Union[str, "Frame"]]] = {}
+
+    def connect(self, websocket: WebSocket, policy: Optional[str] = None):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.queues[websocket] = queue
+        self.policies[websocket] = policy or self.policy
+        self.coalesced[websocket] = {}
+        self.writers[websocket] = asyncio.create_task(self._writer(websocket, queue))
+
+    def set_policy(self, websocket: WebSocket, policy: Optional[str] = None):
+        if websocket in self.queues:
+            self.policies[websocket] = policy or self.policy
+
+    def disconnect(self, websocket: WebSocket):
+        self.queues.pop(websocket, None)
+        self.policies.pop(websocket, None)
+        self.coalesced.pop(websocket, None)
+        writer = self.writers.pop(websocket, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+
+    def publish(self, message: Union[str, "Frame"]):
+        for websocket in list(self.queues):
+            self.send(websocket, message)
+
+    def send(self, websocket: WebSocket, message: Union[str, "Frame"], coalesce: Optional[str] = None):
+        queue = self.queues.get(websocket)
+        if queue is None:
+            return
+        if coalesce is not None:
+            pending = self.coalesced[websocket]
+            replaced = coalesce in pending
+            pending[coalesce] = message
+            if replaced:
+                websocket_dropped_frames.inc((self.name, "coalesce"))
+                return
+            message = CoalescedSlot(coalesce)
+        if not queue.full():
+            queue.put_nowait(message)
+        elif self.policies[websocket] == "disconnect":
+            websocket_dropped_frames.inc((self.name, "disconnect"), queue.qsize() + 1)
+            websocket_slow_consumer_disconnects.inc((self.name,))
+            self._drop(websocket)
+        else:
+            dropped = queue.get_nowait()
+            if isinstance(dropped, CoalescedSlot):
+                self.coalesced[websocket].pop(dropped.key, None)
+            queue.put_nowait(message)
+            websocket_dropped_frames.inc((self.name, "drop_oldest"))
+
+    def _drop(self, websocket: WebSocket):
+        self.disconnect(websocket)
+        if self.on_drop is not None:
+            self.on_drop(websocket)
+        asyncio.create_task(self._close(websocket))
+
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue):
+        try:
+            while True:
+                message = await queue.get()
+                if isinstance(message, CoalescedSlot):
+                    message = self.coalesced[websocket].pop(message.key)
+                with timed(websocket_send_duration, self.name):
+                    if isinstance(message, str):
+                        await asyncio.wait_for(websocket.send_text(message), timeout=self.send_timeout)
+                    else:
+                        await asyncio.wait_for(send_frame(websocket, message), timeout=self.send_timeout)
+        except Exception as e:
+            # Include erorile de codificare: clientul e inchis, nu ramas conectat fara update-uri
+            print(f"Trimitere WebSocket esuata ({self.name}): {e!r}")
+            websocket_send_failures.inc((self.name,))
+            self._drop(websocket)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+
+relay_hub = BroadcastHub("relay", RELAY_QUEUE_SIZE, RELAY_SLOW_CONSUMER_POLICY, RELAY_SEND_TIMEOUT)
+
+
+@app.websocket("/ws/relay")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    active_connections.append(websocket)
+    relay_hub.connect(websocket)
     try:
         while True:
             data = await websocket.receive_text()
-            for connection in active_connections:
-                try:
-                    await connection.send_text(f"Update: {data}")
-                except:
-                    if connection in active_connections:
-                        active_connections.remove(connection)
+            relay_hub.publish(f"Update: {data}")
+            publish_event("relay", message=f"Update: {data}")
     except WebSocketDisconnect:
-        if websocket in active_connections:
-            active_connections.remove(websocket)
+        pass
+    finally:
+        relay_hub.disconnect(websocket)
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  
@@ -130,152 +399,1218 @@ app.add_middleware(
 )
 
 
-def get_db_connection():
+# Metrici in format text Prometheus. Tot ce e pe hot path e un perf_counter si un dict lookup;
+# agregarea (bucket-uri cumulative, formatare) se face doar la GET /metrics
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in list(self.series.items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [numarul de observatii per bucket (necumulativ, ultimul e +Inf), suma, total]
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        bucket_names = self.label_names + ("le",)
+        for labels, (counts, total, count) in list(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(bucket_names, labels + (bound,))} {cumulative}")
+            label_text = format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Latenta request-urilor HTTP per ruta", ("method", "route", "status")
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "Durata query-urilor catre Postgres, per query", ("query",)
+)
+db_pool_acquire_duration = Histogram(
+    "db_pool_acquire_duration_seconds", "Asteptarea unei conexiuni libere din pool-ul asyncpg"
+)
+serialization_duration = Histogram(
+    "serialization_duration_seconds", "Durata serializarii JSON a payload-urilor mari", ("payload",)
+)
+broadcast_duration = Histogram(
+    "websocket_broadcast_duration_seconds", "Durata punerii unui update in cozile tuturor clientilor WebSocket",
+    ("endpoint",)
+)
+websocket_send_duration = Histogram(
+    "websocket_send_duration_seconds", "Durata unei trimiteri catre un client WebSocket (din task-ul lui de scriere)",
+    ("endpoint",)
+)
+detections_received = Counter(
+    "parking_detections_total", "Detectii primite per parcare (rate() = ritmul de ingest)",
+    ("parking_number", "changed")
+)
+websocket_send_failures = Counter(
+    "websocket_send_failures_total", "Trimiteri WebSocket esuate (client deconectat sau lent)", ("endpoint",)
+)
+websocket_dropped_frames = Counter(
+    "websocket_dropped_frames_total", "Mesaje aruncate pentru clienti lenti, per politica", ("endpoint", "policy")
+)
+websocket_slow_consumer_disconnects = Counter(
+    "websocket_slow_consumer_disconnects_total", "Clienti deconectati pentru ca nu tineau pasul", ("endpoint",)
+)
+pubsub_events = Counter(
+    "pubsub_events_total", "Evenimente schimbate cu ceilalti workeri, per tip si directie (published, received, dropped)", ("kind", "direction")
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, name: str):
+    start = time.perf_counter()
     try:
-        conn = psycopg2.connect(
-            dbname="smart_park",
-            user="postgres",
-            password="d",
-            host="localhost",
-            port="5432",
-            cursor_factory=RealDictCursor,
-            sslmode="require"
-        )
+        yield
+    finally:
+        histogram.observe((name,), time.perf_counter() - start)
+
+
+def render_websocket_gauge() -> List[str]:
+    name = "websocket_connections"
+    lines = [f"# HELP {name} Conexiuni WebSocket active", f"# TYPE {name} gauge"]
+    for endpoint, count in (
+        ("parking", len(parking_subscribers)),
+        ("parking_delta", len(delta_subscribers)),
+        ("parking_filtered", len(lot_subscriptions)),
+        ("zones", len(zone_subscribers)),
+        ("relay", len(relay_hub.queues)),
+    ):
+        lines.append(f"{name}{format_labels(('endpoint',), (endpoint,))} {count}")
+    return lines
+
+
+class MetricsMiddleware:
+    # Middleware ASGI simplu (nu BaseHTTPMiddleware), ca sa nu adauge un task in plus per request
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            # Folosim template-ul rutei (/api/v1/parcari/{parking_number}/history), nu path-ul concret
+            path = getattr(route, "path", "unmatched")
+            http_request_duration.observe((scope["method"], path, status[0]), time.perf_counter() - start)
+
+
+app.add_middleware(MetricsMiddleware)
+
+
+@app.get("/metrics")
+def get_metrics():
+    lines = []
+    for metric in (
+        http_request_duration,
+        db_query_duration,
+        db_pool_acquire_duration,
+        serialization_duration,
+        broadcast_duration,
+        websocket_send_duration,
+        detections_received,
+        websocket_send_failures,
+        websocket_dropped_frames,
+        websocket_slow_consumer_disconnects,
+        pubsub_events,
+    ):
+        lines.extend(metric.render())
+    lines.extend(render_websocket_gauge())
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+async def init_db_connection(conn):
+    # Coloanele json se decodeaza direct in obiecte Python
+    await conn.set_type_codec(
+        "json",
+        encoder=json.dumps,
+        decoder=orjson.loads if orjson is not None else json.loads,
+        schema="pg_catalog"
+    )
+
+
+async def get_db_connection():
+    try:
+        conn = await asyncpg.connect(**DB_SETTINGS, ssl=DB_SSLMODE)
+        await init_db_connection(conn)
         return conn
     except Exception as e:
         print(f"EROARE CRITICĂ DB: {e}")
         raise e
 
 
+db_pool: Optional[asyncpg.Pool] = None
+db_pool_lock = asyncio.Lock()
+
+
+async def get_db_pool() -> asyncpg.Pool:
+    global db_pool
+    if db_pool is None:
+        async with db_pool_lock:
+            if db_pool is None:
+                db_pool = await asyncpg.create_pool(
+                    **DB_SETTINGS,
+                    ssl=DB_SSLMODE,
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    init=init_db_connection
+                )
+    return db_pool
+
+
+@asynccontextmanager
+async def db_connection():
+    # Pool-ul asyncpg asteapta un slot liber pana la DB_POOL_TIMEOUT; conexiunile cazute sunt aruncate la checkout
+    pool = await get_db_pool()
+    for _ in range(DB_POOL_MAX + 1):
+        start = time.perf_counter()
+        try:
+            conn = await pool.acquire(timeout=DB_POOL_TIMEOUT)
+        finally:
+            db_pool_acquire_duration.observe((), time.perf_counter() - start)
+        try:
+            with timed(db_query_duration, "pool_ping"):
+                await conn.execute("SELECT 1")
+        except (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, OSError):
+            await pool.release(conn)
+            continue
+        except BaseException:
+            await pool.release(conn)
+            raise
+        break
+    else:
+        raise asyncpg.InterfaceError("Nu s-a putut obtine o conexiune valida din pool")
+
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+def dumps_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
+
+
+all_parking_cache: Optional[Tuple[str, bytes]] = None
+all_parking_cache_version = 0
+all_parking_cache_lock = threading.Lock()
+
+
+def invalidate_all_parking_cache():
+    global all_parking_cache, all_parking_cache_version
+    with all_parking_cache_lock:
+        all_parking_cache_version += 1
+        all_parking_cache = None
+
+
+async def build_all_parking_data(session: AsyncSession):
+    # Un singur query: geometria vine deja impachetata si ordonata din parking_spots.polygon
+    with timed(db_query_duration, "all_parking_spots"):
+        spots = (await session.exec(
+            select(
+                ParkingSpot.parking_number,
+                ParkingSpot.parking_name,
+                ParkingSpot.empty_spots,
+                ParkingSpot.occupied_spots,
+                ParkingSpot.total_spots,
+                ParkingSpot.price_per_hour,
+                ParkingSpot.schedule,
+                ParkingSpot.has_surveillance,
+                ParkingSpot.has_disabled_access,
+                ParkingSpot.has_ev_charging,
+                ParkingSpot.polygon,
+            ).order_by(ParkingSpot.parking_number)
+        )).all()
+
+    return [
+        {
+            "parking_number": spot.parking_number,
+            "parking_name": spot.parking_name,
+            "empty_spots": spot.empty_spots,
+            "occupied_spots": spot.occupied_spots,
+            "total_spots": spot.total_spots,
+            "price_per_hour": float(spot.price_per_hour) if spot.price_per_hour is not None else None,
+            "schedule": spot.schedule,
+            "has_surveillance": spot.has_surveillance,
+            "has_disabled_access": spot.has_disabled_access,
+            "has_ev_charging": spot.has_ev_charging,
+            "coordinates": unpack_polygon(spot.polygon)
+        }
+        for spot in spots
+    ]
+
+
+async def get_all_parking_snapshot(session: AsyncSession) -> Tuple[str, bytes]:
+    global all_parking_cache
+    cached = all_parking_cache
+    if cached is not None:
+        return cached
+
+    version = all_parking_cache_version
+    data = await build_all_parking_data(session)
+    with timed(serialization_duration, "all_parking"):
+        body = dumps_json(data)
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    with all_parking_cache_lock:
+        # Daca a venit o detectie in timp ce construiam, nu salvam un snapshot deja vechi
+        if version == all_parking_cache_version:
+            all_parking_cache = (etag, body)
+    return etag, body
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
 @app.get("/api/v1/parcari/all")
-def get_all_parking_data(session: Session = Depends(get_session)):
+async def get_all_parking_data(request: Request, session: AsyncSession = Depends(get_session)):
     try:
-        statement = select(ParkingSpot)
-        results = session.exec(statement).all()
-        
-        final_results = []
-        for spot in results:
-            spot.coordinates.sort(key=lambda coord: coord.point_order)
-            spot_dict = {
-                "parking_number": spot.parking_number,
-                "parking_name": spot.parking_name,
-                "empty_spots": spot.empty_spots,
-                "occupied_spots": spot.occupied_spots,
-                "total_spots": spot.total_spots,
-                "price_per_hour": float(spot.price_per_hour) if spot.price_per_hour is not None else None,
-                "schedule": spot.schedule,
-                "has_surveillance": spot.has_surveillance,
-		        "has_disabled_access": spot.has_disabled_access,
-		        "has_ev_charging": spot.has_ev_charging,
-                "coordinates": [
-                    {
-                        "latitude": float(c.latitude),
-                        "longitude": float(c.longitude),
-                        "point_order": c.point_order
-                    } for c in spot.coordinates
-                ]
-            }
-            final_results.append(spot_dict)
-        return final_results
+        etag, body = await get_all_parking_snapshot(session)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
     except Exception as e:
         traceback.print_exc()
         return {"status": "error", "message": str(e)}
         
 
+# Format polygon: cate 20 de octeti per punct, big-endian ca float8send/int4send din Postgres
+# (asa il poate construi si migrarea direct in SQL): latitude f8, longitude f8, point_order i4
+POLYGON_POINT = struct.Struct(">ddi")
+GEOMETRY_COLUMNS = ["polygon", "bbox_min_lat", "bbox_min_lon", "bbox_max_lat", "bbox_max_lon", "centroid_lat", "centroid_lon"]
+
+
+def pack_polygon(coordinates) -> dict:
+    points = sorted(
+        ((coord.latitude, coord.longitude, coord.point_order) for coord in coordinates),
+        key=lambda point: point[2]
+    )
+    if not points:
+        return dict.fromkeys(GEOMETRY_COLUMNS, None) | {"polygon": b""}
+    lats = [point[0] for point in points]
+    lons = [point[1] for point in points]
+    return {
+        "polygon": b"".join(POLYGON_POINT.pack(*point) for point in points),
+        "bbox_min_lat": min(lats),
+        "bbox_min_lon": min(lons),
+        "bbox_max_lat": max(lats),
+        "bbox_max_lon": max(lons),
+        "centroid_lat": sum(lats) / len(lats),
+        "centroid_lon": sum(lons) / len(lons),
+    }
+
+
+def unpack_polygon(polygon: Optional[bytes]) -> List[dict]:
+    if not polygon:
+        return []
+    return [
+        {"latitude": latitude, "longitude": longitude, "point_order": point_order}
+        for latitude, longitude, point_order in POLYGON_POINT.iter_unpack(polygon)
+    ]
+
+
+def lot_from_create(parking_number: int, spot_data: ParkingSpotCreate) -> dict:
+    return {
+        "parking_number": parking_number,
+        **spot_data.model_dump(exclude={"coordinates"}),
+        "coordinates": sorted(
+            (coord.model_dump() for coord in spot_data.coordinates),
+            key=lambda coord: coord["point_order"]
+        )
+    }
+
+
 @app.post("/api/v1/parcari", status_code=201) 
-def create_parking_spot(spot_data: ParkingSpotCreate, session: Session = Depends(get_session)):
+async def create_parking_spot(spot_data: ParkingSpotCreate, session: AsyncSession = Depends(get_session)):
     try:
         parking_spot_dict = spot_data.model_dump(exclude={"coordinates"})
-        parking_spot = ParkingSpot(**parking_spot_dict)
+        parking_spot = ParkingSpot(**parking_spot_dict, **pack_polygon(spot_data.coordinates))
         
         session.add(parking_spot)
-        session.commit()
-        session.refresh(parking_spot)
+        with timed(db_query_duration, "create_spot"):
+            await session.commit()
+            await session.refresh(parking_spot)
+        parking_number = parking_spot.parking_number
         
         for coord_in in spot_data.coordinates:
             parking_coordinate = ParkingCoordinate(
                 latitude=coord_in.latitude,
                 longitude=coord_in.longitude,
                 point_order=coord_in.point_order,
-                parking_number=parking_spot.parking_number
+                parking_number=parking_number
             )
             session.add(parking_coordinate)
-        session.commit()
-        return {"status": "success", "parking_number": parking_spot.parking_number}
+        with timed(db_query_duration, "create_coordinates"):
+            await session.commit()
+        notify_parking_changed()
+        lot = lot_from_create(parking_number, spot_data)
+        spatial_index.add(lot)
+        zone_counters.add_lot(lot)
+        publish_event("structure")
+        return {"status": "success", "parking_number": parking_number}
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+
+
+
+# Import in bloc: toate parcarile si coordonatele intr-o singura tranzactie, cu INSERT-uri multi-row.
+# Erorile sunt raportate per feature; o parcare invalida nu opreste importul celorlalte.
+PARKING_SPOT_COLUMNS = [
+    "parking_number", "parking_name", "empty_spots", "occupied_spots", "total_spots",
+    "price_per_hour", "schedule", "has_surveillance", "has_disabled_access", "has_ev_charging",
+] + GEOMETRY_COLUMNS
+INSERT_SPOTS_SQL = f"""
+    INSERT INTO parking_spots ({', '.join(PARKING_SPOT_COLUMNS)})
+    SELECT * FROM unnest(
+        $1::integer[], $2::varchar[], $3::integer[], $4::integer[], $5::integer[],
+        $6::float8[], $7::varchar[], $8::boolean[], $9::boolean[], $10::boolean[],
+        $11::bytea[], $12::float8[], $13::float8[], $14::float8[], $15::float8[], $16::float8[], $17::float8[]
+    )
+"""
+INSERT_COORDINATES_SQL = """
+    INSERT INTO parking_coordinates (parking_number, latitude, longitude, point_order)
+    SELECT * FROM unnest($1::integer[], $2::float8[], $3::float8[], $4::integer[])
+"""
+
+
+def as_columns(rows: List[tuple], width: int) -> List[list]:
+    # INSERT ... SELECT FROM unnest(...) primeste cate un array per coloana
+    if not rows:
+        return [[] for _ in range(width)]
+    return [list(column) for column in zip(*rows)]
+
+
+def geojson_feature_to_spot(feature: dict) -> dict:
+    if feature.get("type") != "Feature":
+        raise ValueError("Se astepta un obiect GeoJSON de tip Feature")
+    geometry = feature.get("geometry") or {}
+    properties = dict(feature.get("properties") or {})
+
+    if geometry.get("type") == "Polygon":
+        ring = geometry["coordinates"][0]
+        if len(ring) > 1 and ring[0] == ring[-1]:
+            ring = ring[:-1]
+    elif geometry.get("type") == "LineString":
+        ring = geometry["coordinates"]
+    else:
+        raise ValueError(f"Geometrie nesuportata: {geometry.get('type')} (Polygon sau LineString)")
+
+    if "parking_name" not in properties:
+        properties["parking_name"] = properties.pop("name", None)
+    properties["coordinates"] = [
+        {"latitude": point[1], "longitude": point[0], "point_order": order}
+        for order, point in enumerate(ring)
+    ]
+    return properties
+
+
+def parse_import_payload(payload: Union[dict, list]) -> Tuple[List[Tuple[int, ParkingSpotCreate]], List[dict]]:
+    if isinstance(payload, dict) and payload.get("type") == "FeatureCollection":
+        items = payload.get("features") or []
+        is_geojson = True
+    elif isinstance(payload, list):
+        items = payload
+        is_geojson = False
+    else:
+        raise ValueError("Se astepta un FeatureCollection GeoJSON sau o lista de parcari")
+
+    spots, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            data = geojson_feature_to_spot(item) if is_geojson else item
+            spot = ParkingSpotCreate.model_validate(data)
+            if spot.total_spots < 0 or spot.empty_spots + spot.occupied_spots > spot.total_spots:
+                raise ValueError("empty_spots + occupied_spots depaseste total_spots")
+            spots.append((index, spot))
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errors.append({"index": index, "message": message})
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            errors.append({"index": index, "message": str(e)})
+    return spots, errors
+
+
+def spot_insert_rows(parking_number: int, spot: ParkingSpotCreate):
+    values = spot.model_dump(exclude={"coordinates"}) | pack_polygon(spot.coordinates)
+    spot_row = tuple([parking_number] + [values[column] for column in PARKING_SPOT_COLUMNS[1:]])
+    coordinate_rows = [
+        (parking_number, coord.latitude, coord.longitude, coord.point_order)
+        for coord in spot.coordinates
+    ]
+    return spot_row, coordinate_rows
+
+
+async def insert_parking_rows(conn, spot_rows: List[tuple], coordinate_rows: List[tuple]):
+    with timed(db_query_duration, "import_spots"):
+        await conn.execute(INSERT_SPOTS_SQL, *as_columns(spot_rows, len(PARKING_SPOT_COLUMNS)))
+    if coordinate_rows:
+        with timed(db_query_duration, "import_coordinates"):
+            await conn.execute(INSERT_COORDINATES_SQL, *as_columns(coordinate_rows, 4))
+
+
+async def import_parking_spots(spots: List[Tuple[int, ParkingSpotCreate]]) -> Tuple[List[dict], List[dict]]:
+    if not spots:
+        return [], []
+
+    async with db_connection() as conn:
+        # Rezervam ID-urile dinainte ca sa putem insera coordonatele fara RETURNING per rand
+        with timed(db_query_duration, "import_reserve_ids"):
+            ids = [
+                row["id"] for row in await conn.fetch(
+                    "SELECT nextval(pg_get_serial_sequence('parking_spots', 'parking_number')) AS id "
+                    "FROM generate_series(1, $1)",
+                    len(spots)
+                )
+            ]
+        prepared = [
+            (index, parking_number, spot, *spot_insert_rows(parking_number, spot))
+            for (index, spot), parking_number in zip(spots, ids)
+        ]
+
+        created, errors = [], []
+        try:
+            async with conn.transaction():
+                await insert_parking_rows(
+                    conn,
+                    [item[3] for item in prepared],
+                    [row for item in prepared for row in item[4]]
+                )
+            created = [(index, parking_number, spot) for index, parking_number, spot, _, _ in prepared]
+        except asyncpg.PostgresError:
+            # Un rand invalid a picat tot INSERT-ul: reluam parcare cu parcare, cu savepoint,
+            # ca sa izolam doar feature-urile cu probleme
+            async with conn.transaction():
+                for index, parking_number, spot, spot_row, coordinate_rows in prepared:
+                    try:
+                        async with conn.transaction():
+                            await insert_parking_rows(conn, [spot_row], coordinate_rows)
+                        created.append((index, parking_number, spot))
+                    except asyncpg.PostgresError as e:
+                        errors.append({"index": index, "message": str(e).strip()})
+
+    if created:
+        notify_parking_changed()
+        publish_event("structure")
+        for _, parking_number, spot in created:
+            lot = lot_from_create(parking_number, spot)
+            spatial_index.add(lot)
+            zone_counters.add_lot(lot)
+
+    return [{"index": index, "parking_number": parking_number} for index, parking_number, _ in created], errors
+
+
+@app.post("/api/v1/parcari/import")
+async def import_parking_data(payload: Union[Dict[str, Any], List[Dict[str, Any]]] = Body(...)):
+    try:
+        spots, errors = parse_import_payload(payload)
+        created, insert_errors = await import_parking_spots(spots)
+        errors = sorted(errors + insert_errors, key=lambda error: error["index"])
+
+        if not errors:
+            status = "success"
+        elif created:
+            status = "partial"
+        else:
+            status = "error"
+        return {"status": status, "created": created, "errors": errors}
     except Exception as e:
         traceback.print_exc()
         return {"status": "error", "message": str(e)}
 
 
+PARKING_SNAPSHOT_SQL = """
+    SELECT 
+        ps.parking_number,
+        ps.parking_name,
+        ps.empty_spots,
+        ps.occupied_spots,
+        ps.total_spots,
+        ps.price_per_hour,
+        ps.schedule,
+        ps.has_surveillance,
+        ps.has_disabled_access, 
+        ps.has_ev_charging,
+        ps.polygon AS coordinates
+    FROM parking_spots ps
+    ORDER BY ps.parking_number
+"""
+
+
+async def fetch_parking_snapshot():
+    async with db_connection() as conn:
+        with timed(db_query_duration, "parking_snapshot"):
+            rows = await conn.fetch(PARKING_SNAPSHOT_SQL)
+
+    return [clean_parking_row(row) for row in rows]
+
+
+def clean_parking_row(row) -> dict:
+    cleaned = {k: (float(v) if isinstance(v, Decimal) else v) for k, v in row.items()}
+    cleaned["coordinates"] = unpack_polygon(cleaned["coordinates"])
+    return cleaned
+
+
+def notify_parking_changed():
+    invalidate_all_parking_cache()
+    # Poate fi apelat si din alt thread (ex. handler-e sync), deci trecem prin loop-ul principal
+    if broadcast_loop is not None and parking_changed is not None:
+        broadcast_loop.call_soon_threadsafe(parking_changed.set)
+
+
+# Pub/sub intre workeri: fiecare proces uvicorn are propriii clienti WebSocket si propriile cache-uri,
+# deci orice schimbare facuta de un worker e anuntata si celorlalti. "postgres" (LISTEN/NOTIFY) e implicit;
+# "memory" livreaza doar in procesul curent (un singur worker, teste).
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "postgres")
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "parking_events")
+PUBSUB_HEARTBEAT_INTERVAL = float(os.getenv("PUBSUB_HEARTBEAT_INTERVAL", "5"))
+PUBSUB_RECONNECT_INTERVAL = float(os.getenv("PUBSUB_RECONNECT_INTERVAL", "2"))
+# NOTIFY accepta payload-uri de cel mult 8000 de octeti; un rand de ocupare are ~80
+PUBSUB_MAX_PAYLOAD = 7900
+PUBSUB_ROWS_PER_MESSAGE = 50
+WORKER_ID = uuid.uuid4().hex
+
+
+class PubSub(ABC):
+    def __init__(self):
+        self.handlers: List[Any] = []
+
+    def subscribe(self, handler):
+        self.handlers.append(handler)
+
+    def dispatch(self, event: dict):
+        pubsub_events.inc((event.get("kind"), "received"))
+        for handler in self.handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"Eroare la procesarea evenimentului {event.get('kind')}: {e}")
+                traceback.print_exc()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    def publish(self, event: dict):
+        pass
+
+
+class InProcessPubSub(PubSub):
+    def publish(self, event: dict):
+        pubsub_events.inc((event["kind"], "published"))
+        self.dispatch(event)
+
+
+class PostgresPubSub(PubSub):
+    # Trimiterea se face dintr-un task separat: evenimentele adunate intre doua treceri se comaseaza
+    # (ultimul rand per parcare castiga), ca un val de detectii sa nu ceara cate un NOTIFY fiecare
+    def __init__(self, channel: str):
+        super().__init__()
+        self.channel = channel
+        self.outbox: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        self.outbox = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._send())]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def publish(self, event: dict):
+        if self.outbox is not None:
+            self.outbox.put_nowait(event)
+
+    def _payloads(self, events: List[dict]) -> List[str]:
+        rows: Dict[int, dict] = {}
+        structure = False
+        payloads = []
+        for event in events:
+            if event["kind"] == "counts":
+                rows.update((row["parking_number"], row) for row in event["rows"])
+                continue
+            if event["kind"] == "structure":
+                structure = True
+                continue
+            payload = json.dumps(event)
+            size = len(payload.encode())
+            if size > PUBSUB_MAX_PAYLOAD:
+                pubsub_events.inc((event["kind"], "dropped"))
+                print(f"Eveniment {event['kind']} prea mare pentru NOTIFY ({size} octeti), nu e propagat")
+                continue
+            payloads.append(payload)
+
+        if structure:
+            payloads.append(json.dumps({"kind": "structure", "origin": WORKER_ID}))
+        rows = list(rows.values())
+        for start in range(0, len(rows), PUBSUB_ROWS_PER_MESSAGE):
+            payloads.append(json.dumps(
+                {"kind": "counts", "origin": WORKER_ID, "rows": rows[start:start + PUBSUB_ROWS_PER_MESSAGE]}
+            ))
+        return payloads
+
+    async def _send(self):
+        while True:
+            events = [await self.outbox.get()]
+            while not self.outbox.empty():
+                events.append(self.outbox.get_nowait())
+            for event in events:
+                pubsub_events.inc((event["kind"], "published"))
+            try:
+                async with db_connection() as conn:
+                    with timed(db_query_duration, "pubsub_notify"):
+                        await conn.executemany(
+                            "SELECT pg_notify($1, $2)", [(self.channel, p) for p in self._payloads(events)]
+                        )
+            except Exception as e:
+                print(f"Eroare la publicarea evenimentelor: {e}")
+                traceback.print_exc()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        self.dispatch(event)
+
+    async def _listen(self):
+        # Conexiune dedicata (LISTEN o tine ocupata), nu din pool; la pierderea ei ne reconectam
+        # si tratam totul ca o schimbare structurala, pentru ca e posibil sa fi pierdut evenimente
+        connected_before = False
+        while True:
+            conn = None
+            try:
+                conn = await get_db_connection()
+                await conn.add_listener(self.channel, self._on_notify)
+                if connected_before:
+                    print("Pub/sub reconectat, resincronizam starea locala")
+                    self.dispatch({"kind": "structure", "origin": None})
+                connected_before = True
+                while True:
+                    await asyncio.sleep(PUBSUB_HEARTBEAT_INTERVAL)
+                    await conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Conexiunea pub/sub a cazut: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    try:
+                        await conn.close(timeout=1)
+                    except Exception:
+                        conn.terminate()
+            await asyncio.sleep(PUBSUB_RECONNECT_INTERVAL)
+
+
+def create_pubsub(backend: str) -> PubSub:
+    if backend == "memory":
+        return InProcessPubSub()
+    if backend == "postgres":
+        return PostgresPubSub(PUBSUB_CHANNEL)
+    raise ValueError(f"PUBSUB_BACKEND necunoscut: {backend}")
+
+
+def publish_event(kind: str, **data):
+    if broadcast_loop is None:
+        return
+    broadcast_loop.call_soon_threadsafe(pubsub.publish, {"kind": kind, "origin": WORKER_ID, **data})
+
+
+index_reload_task: Optional[asyncio.Task] = None
+index_reload_pending = False
+
+
+async def reload_local_indexes():
+    global index_reload_pending
+    while index_reload_pending:
+        index_reload_pending = False
+        await load_spatial_index()
+        # Broadcaster-ul poate fi trecut deja prin schimbarea structurala cu indexul vechi:
+        # abonamentele pe bbox se recalculeaza acum si primesc snapshot filtrat la urmatoarea trecere
+        resync_bbox_subscriptions()
+        await load_zone_counters()
+        # Clientii /ws/zones primesc valorile reincarcate
+        zone_counters.dirty.update(zone_counters.zones)
+        parking_changed.set()
+
+
+def schedule_index_reload():
+    global index_reload_task, index_reload_pending
+    index_reload_pending = True
+    if index_reload_task is None or index_reload_task.done():
+        index_reload_task = asyncio.create_task(reload_local_indexes())
+
+
+def handle_event(event: dict):
+    # Evenimentele proprii sunt deja aplicate local inainte de publicare
+    if event.get("origin") == WORKER_ID:
+        return
+    kind = event.get("kind")
+    if kind == "counts":
+        for row in event["rows"]:
+            remember_detection(row)
+        notify_parking_changed()
+    elif kind == "structure":
+        notify_parking_changed()
+        schedule_index_reload()
+    elif kind == "relay":
+        relay_hub.publish(event["message"])
+
+
+pubsub = create_pubsub(PUBSUB_BACKEND)
+pubsub.subscribe(handle_event)
+
+
+def diff_parking_rows(previous: Dict[int, dict], rows: List[dict]):
+    # Intoarce (changes, structural); structural=True cand s-a schimbat altceva decat ocuparea
+    if len(previous) != len(rows):
+        return [], True
+
+    changes = []
+    for row in rows:
+        old = previous.get(row["parking_number"])
+        if old is None:
+            return [], True
+        if old == row:
+            continue
+        if any(old[k] != row[k] for k in row if k not in ("empty_spots", "occupied_spots")):
+            return [], True
+        changes.append([row[field] for field in DELTA_FIELDS])
+    return changes, False
+
+
+WS_ENCODINGS = ("json", "msgpack", "binary")
+JSON_FORMAT = ("json", False)
+FRAME_COMPRESS_LEVEL = int(os.getenv("FRAME_COMPRESS_LEVEL", "6"))
+# Format binar (doar ocuparea): antet <BqqI (tip, versiune, versiune de baza, numar loturi),
+# apoi cate 12 octeti per lot <Iii (parking_number, empty_spots, occupied_spots). Contoarele sunt cu semn:
+# occupied_spots = total_spots - free_spots poate iesi negativ, iar un frame necodificabil ar inchide clientii
+BINARY_HEADER = struct.Struct("<BqqI")
+BINARY_LOT = struct.Struct("<Iii")
+BINARY_TYPES = {"snapshot": 1, "delta": 2}
+
+
+def encode_binary_frame(payload: dict) -> bytes:
+    if payload["type"] == "snapshot":
+        lots = [(lot["parking_number"], lot["empty_spots"], lot["occupied_spots"]) for lot in payload["lots"]]
+    else:
+        lots = payload["changes"]
+    body = bytearray(BINARY_HEADER.size + BINARY_LOT.size * len(lots))
+    BINARY_HEADER.pack_into(body, 0, BINARY_TYPES[payload["type"]], payload["version"], payload.get("base", 0), len(lots))
+    offset = BINARY_HEADER.size
+    for parking_number, empty_spots, occupied_spots in lots:
+        BINARY_LOT.pack_into(body, offset, parking_number, empty_spots, occupied_spots)
+        offset += BINARY_LOT.size
+    return bytes(body)
+
+
+def encode_frame(payload, encoding: str, compress: bool) -> Union[str, bytes]:
+    if encoding == "binary":
+        data = encode_binary_frame(payload)
+    elif encoding == "msgpack":
+        data = msgpack.packb(payload)
+    else:
+        data = json.dumps(payload)
+    if compress:
+        data = zlib.compress(data.encode() if isinstance(data, str) else data, FRAME_COMPRESS_LEVEL)
+    return data
+
+
+class Frame:
+    # Un mesaj catre clientii WebSocket, codificat o singura data per format, nu o data per client
+    def __init__(self, name: str, payload):
+        self.name = name
+        self.payload = payload
+        self._encoded: Dict[Tuple[str, bool], Union[str, bytes]] = {}
+
+    def encode(self, fmt: Tuple[str, bool]) -> Union[str, bytes]:
+        data = self._encoded.get(fmt)
+        if data is None:
+            encoding, compress = fmt
+            with timed(serialization_duration, f"{self.name}.{encoding}{'+deflate' if compress else ''}"):
+                data = self._encoded[fmt] = encode_frame(self.payload, encoding, compress)
+        return data
+
+
+def parse_ws_format(websocket: WebSocket, delta_mode: bool) -> Tuple[str, bool]:
+    encoding = websocket.query_params.get("encoding", "json")
+    compress = websocket.query_params.get("compress")
+    if encoding not in WS_ENCODINGS:
+        raise ValueError(f"Encoding necunoscut: {encoding} (json, msgpack sau binary)")
+    if encoding == "msgpack" and msgpack is None:
+        raise ValueError("msgpack nu este instalat pe server")
+    if encoding == "binary" and not delta_mode:
+        raise ValueError("encoding=binary necesita protocol=delta")
+    if compress not in (None, "deflate"):
+        raise ValueError(f"Compresie necunoscuta: {compress} (deflate)")
+    return encoding, compress == "deflate"
+
+
+async def send_frame(websocket: WebSocket, frame: Frame):
+    data = frame.encode(ws_formats.get(websocket, JSON_FORMAT))
+    if isinstance(data, bytes):
+        await websocket.send_bytes(data)
+    else:
+        await websocket.send_text(data)
+
+
+def build_delta_snapshot_message(rows: List[dict]) -> Frame:
+    return Frame("parking_delta_snapshot", {"type": "snapshot", "version": parking_version, "lots": rows})
+
+
+def send_to_subscribers(hub: BroadcastHub, messages: Dict[WebSocket, Frame], kind: str,
+                        coalesce: Optional[str] = None):
+    # Doar pune in cozile clientilor; clientii care nu mai pot primi sunt scosi de hub (on_drop)
+    if not messages:
+        return
+    with timed(broadcast_duration, kind):
+        for ws, frame in messages.items():
+            hub.send(ws, frame, coalesce)
+
+
+def broadcast_parking_snapshot(frame: Frame):
+    send_to_subscribers(parking_hub, {ws: frame for ws in parking_subscribers}, "parking", SNAPSHOT_SLOT)
+
+
+def broadcast_parking_delta(base_version: int, changes: List[list], structural: bool):
+    global latest_delta_snapshot
+    if structural:
+        delta_message = None
+    else:
+        delta_message = Frame("parking_delta", {
+            "type": "delta",
+            "version": parking_version,
+            "base": base_version,
+            "fields": DELTA_FIELDS,
+            "changes": changes,
+        })
+
+    messages = {}
+    for ws, client_version in delta_subscribers.items():
+        if client_version == parking_version:
+            continue
+        if delta_message is not None and client_version == base_version:
+            messages[ws] = delta_message
+        else:
+            # Client ramas in urma (sau schimbare structurala): primeste snapshot complet
+            messages[ws] = latest_delta_snapshot
+
+    send_to_subscribers(parking_hub, messages, "parking_delta")
+    for ws in messages:
+        if ws in delta_subscribers:
+            delta_subscribers[ws] = parking_version
+
+
+async def parking_broadcaster():
+    global latest_parking_snapshot, latest_delta_snapshot, parking_version, parking_rows
+    while True:
+        try:
+            await asyncio.wait_for(parking_changed.wait(), timeout=BROADCAST_FALLBACK_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        changed = parking_changed.is_set()
+        parking_changed.clear()
+        # Zonele nu au nevoie de DB: contoarele sunt deja actualizate, trimitem doar ce s-a schimbat
+        broadcast_zone_changes()
+
+        if not parking_subscribers and not delta_subscribers and not lot_subscriptions:
+            # Nimeni conectat: nu interogam DB-ul, doar marcam snapshot-ul ca expirat
+            if changed:
+                latest_parking_snapshot = None
+                latest_delta_snapshot = None
+            continue
+
+        try:
+            rows = await fetch_parking_snapshot()
+        except Exception as db_e:
+            print(f"WebSocket DB Error: {db_e}")
+            traceback.print_exc()
+            continue
+
+        latest_parking_snapshot = Frame("parking_snapshot", rows)
+        broadcast_parking_snapshot(latest_parking_snapshot)
+
+        changes, structural = diff_parking_rows(parking_rows, rows)
+        if changes or structural or latest_delta_snapshot is None:
+            base_version = parking_version
+            parking_version += 1
+            parking_rows = {row["parking_number"]: row for row in rows}
+            latest_delta_snapshot = build_delta_snapshot_message(rows)
+            broadcast_parking_delta(base_version, changes, structural)
+            broadcast_lot_subscriptions(changes, structural)
+        elif unsynced_lot_subscribers:
+            broadcast_lot_subscriptions([], False)
+
+
+def register_delta_subscriber(websocket: WebSocket):
+    since = websocket.query_params.get("since")
+    if latest_delta_snapshot is None:
+        delta_subscribers[websocket] = None
+        notify_parking_changed()
+    elif since is not None and since == str(parking_version):
+        delta_subscribers[websocket] = parking_version
+        parking_hub.send(websocket, json.dumps({"type": "resumed", "version": parking_version}))
+    else:
+        delta_subscribers[websocket] = parking_version
+        parking_hub.send(websocket, latest_delta_snapshot)
+
+
+def resolve_subscription(subscription: dict) -> Set[int]:
+    if subscription["bbox"] is None:
+        return subscription["requested"]
+    min_lat, min_lon, max_lat, max_lon = subscription["bbox"]
+    return {
+        lot["parking_number"]
+        for _, lot in spatial_index.viewport(min_lat, min_lon, max_lat, max_lon, SUBSCRIPTION_MAX_LOTS)
+    }
+
+
+def index_subscription(websocket: WebSocket, lots: Set[int]):
+    subscription = lot_subscriptions[websocket]
+    for parking_number in subscription["lots"] - lots:
+        subscribers = lot_subscribers.get(parking_number)
+        if subscribers is not None:
+            subscribers.discard(websocket)
+            if not subscribers:
+                del lot_subscribers[parking_number]
+    for parking_number in lots - subscription["lots"]:
+        lot_subscribers.setdefault(parking_number, set()).add(websocket)
+    subscription["lots"] = lots
+
+
+def remove_lot_subscription(websocket: WebSocket):
+    if websocket in lot_subscriptions:
+        index_subscription(websocket, set())
+        del lot_subscriptions[websocket]
+    unsynced_lot_subscribers.discard(websocket)
+
+
+def parse_subscription(payload: dict) -> Tuple[Set[int], Optional[Tuple[float, float, float, float]]]:
+    if payload.get("bbox") is not None:
+        bbox = payload["bbox"]
+        if not isinstance(bbox, list) or len(bbox) != 4:
+            raise ValueError("bbox trebuie sa fie [min_lat, min_lon, max_lat, max_lon]")
+        min_lat, min_lon, max_lat, max_lon = (float(value) for value in bbox)
+        if min_lat > max_lat or min_lon > max_lon:
+            raise ValueError("bbox invalid: min > max")
+        return set(), (min_lat, min_lon, max_lat, max_lon)
+
+    lots = payload.get("lots")
+    if not isinstance(lots, list):
+        raise ValueError("Se astepta 'lots' (lista de parking_number) sau 'bbox'")
+    if len(lots) > SUBSCRIPTION_MAX_LOTS:
+        raise ValueError(f"Cel mult {SUBSCRIPTION_MAX_LOTS} parcari per abonament")
+    return {int(parking_number) for parking_number in lots}, None
+
+
+async def subscribe_lots(websocket: WebSocket, payload: dict):
+    requested, bbox = parse_subscription(payload)
+    if bbox is not None:
+        await ensure_spatial_index()
+
+    # Clientul trece din fluxul complet in cel filtrat
+    if websocket in parking_subscribers:
+        parking_subscribers.remove(websocket)
+    delta_subscribers.pop(websocket, None)
+    parking_hub.set_policy(websocket)
+
+    lot_subscriptions.setdefault(websocket, {"lots": set(), "requested": set(), "bbox": None})
+    lot_subscriptions[websocket].update(requested=requested, bbox=bbox)
+    index_subscription(websocket, resolve_subscription(lot_subscriptions[websocket]))
+
+    if latest_delta_snapshot is None:
+        # parking_rows poate fi vechi (nimeni nu era conectat); broadcaster-ul trimite snapshot-ul dupa refresh
+        unsynced_lot_subscribers.add(websocket)
+        notify_parking_changed()
+    else:
+        unsynced_lot_subscribers.discard(websocket)
+        parking_hub.send(websocket, build_filtered_snapshot_message(lot_subscriptions[websocket]["lots"]))
+
+
+def resync_bbox_subscriptions():
+    for websocket, subscription in lot_subscriptions.items():
+        if subscription["bbox"] is not None:
+            index_subscription(websocket, resolve_subscription(subscription))
+            unsynced_lot_subscribers.add(websocket)
+
+
+def build_filtered_snapshot_message(lots: Set[int]) -> Frame:
+    rows = [parking_rows[parking_number] for parking_number in sorted(lots) if parking_number in parking_rows]
+    return Frame("parking_filtered_snapshot", {"type": "snapshot", "version": parking_version, "lots": rows})
+
+
+def broadcast_lot_subscriptions(changes: List[list], structural: bool):
+    if not lot_subscriptions:
+        return
+    if structural:
+        # Loturi adaugate/sterse: abonamentele pe bbox se recalculeaza si toti primesc snapshot filtrat
+        resync_bbox_subscriptions()
+        unsynced_lot_subscribers.update(lot_subscriptions)
+
+    # Fara "base": un client filtrat nu primeste versiunile care nu ating loturile lui
+    messages = {
+        websocket: build_filtered_snapshot_message(lot_subscriptions[websocket]["lots"])
+        for websocket in unsynced_lot_subscribers
+    }
+    unsynced_lot_subscribers.clear()
+
+    client_changes: Dict[WebSocket, list] = {}
+    for change in changes:
+        for websocket in lot_subscribers.get(change[0], ()):
+            if websocket not in messages:
+                client_changes.setdefault(websocket, []).append(change)
+    for websocket, relevant in client_changes.items():
+        messages[websocket] = Frame("parking_filtered_delta", {
+            "type": "delta",
+            "version": parking_version,
+            "fields": DELTA_FIELDS,
+            "changes": relevant,
+        })
+
+    send_to_subscribers(parking_hub, messages, "parking_filtered")
+
+
+def unsubscribe_lots(websocket: WebSocket, delta_mode: bool):
+    if websocket not in lot_subscriptions:
+        return
+    remove_lot_subscription(websocket)
+    if delta_mode:
+        register_delta_subscriber(websocket)
+    else:
+        add_snapshot_subscriber(websocket)
+
+
+def add_snapshot_subscriber(websocket: WebSocket):
+    parking_subscribers.append(websocket)
+    parking_hub.set_policy(websocket, "drop_oldest")
+    if latest_parking_snapshot is not None:
+        parking_hub.send(websocket, latest_parking_snapshot, SNAPSHOT_SLOT)
+    else:
+        notify_parking_changed()
+
+
+def remove_parking_client(websocket: WebSocket):
+    if websocket in parking_subscribers:
+        parking_subscribers.remove(websocket)
+    delta_subscribers.pop(websocket, None)
+    remove_lot_subscription(websocket)
+
+
+# Toate mesajele catre un client /ws/parking (snapshot, delta, pong) trec prin coada lui, in ordine.
+# Un delta pierdut ar strica versiunile clientului, asa ca un client delta/filtrat lent e deconectat si reia
+# cu ?since=. Snapshot-urile complete se inlocuiesc unul pe altul: in coada sta cel mult unul (cel mai nou),
+# iar la coada plina clientii pe fluxul complet pierd cel mai vechi mesaj in loc sa fie deconectati.
+SNAPSHOT_SLOT = "snapshot"
+PARKING_QUEUE_SIZE = int(os.getenv("PARKING_QUEUE_SIZE", "16"))
+PARKING_SEND_TIMEOUT = float(os.getenv("PARKING_SEND_TIMEOUT", "10"))
+parking_hub = BroadcastHub("parking", PARKING_QUEUE_SIZE, "disconnect", PARKING_SEND_TIMEOUT, remove_parking_client)
+
 
 @app.websocket("/ws/parking")   
 async def websocket_parking(websocket: WebSocket):
     await websocket.accept()
     print("Client connected to /ws/parking")
-    
+    delta_mode = websocket.query_params.get("protocol") == "delta"
+    try:
+        ws_formats[websocket] = parse_ws_format(websocket, delta_mode)
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=1003)
+        return
+
+    parking_hub.connect(websocket)
     try:
+        if delta_mode:
+            register_delta_subscriber(websocket)
+        else:
+            add_snapshot_subscriber(websocket)
+
         while True:
+            message = await websocket.receive_text()
             try:
-                conn = get_db_connection()
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT 
-                        ps.parking_number,
-                        ps.parking_name,
-                        ps.empty_spots,
-                        ps.occupied_spots,
-                        ps.total_spots,
-                        ps.price_per_hour,
-                        ps.schedule
-			            ps.has_surveillance,
-			            ps.has_disabled_access, 
-			            ps.has_ev_charging,,
-                        COALESCE(
-                            json_agg(
-                                json_build_object(
-                                    'latitude', pc.latitude,
-                                    'longitude', pc.longitude,
-                                    'point_order', pc.point_order
-                                ) ORDER BY pc.point_order
-                            ) FILTER (WHERE pc.coord_id IS NOT NULL),
-                            '[]'::json
-                        ) as coordinates
-                    FROM parking_spots ps
-                    LEFT JOIN parking_coordinates pc ON ps.parking_number = pc.parking_number
-                    GROUP BY ps.parking_number, ps.parking_name, ps.empty_spots, 
-                             ps.occupied_spots, ps.total_spots, ps.price_per_hour, ps.schedule, 
-                             ps.has_surveillance, ps.has_disabled_access, ps.has_ev_charging
-
-                    ORDER BY ps.parking_number
-                """)
-                rows = cur.fetchall()
-                cur.close()
-                conn.close()
-                
-                serializable_rows = []
-                for row in rows:
-                    clean_row = {
-                        k: (float(v) if isinstance(v, Decimal) else v) 
-                        for k, v in row.items()
-                    }
-                    serializable_rows.append(clean_row)
-                
+                payload = json.loads(message)
+            except ValueError:
+                continue
+            if not isinstance(payload, dict):
+                continue
+            message_type = payload.get("type")
+            if message_type == "ping":
+                parking_hub.send(websocket, json.dumps({"type": "pong"}))
+            elif message_type == "subscribe":
                 try:
-                    await websocket.send_json(serializable_rows)
-                except Exception:
-                    break
-                    
-            except Exception as db_e:
-                # Doar erori de bază de date (nu de WebSocket)
-                if "ClientDisconnected" not in str(type(db_e).__name__):
-                    print(f"WebSocket DB Error: {db_e}")
-                    traceback.print_exc()
-                else:
-                    # Client deconectat
-                    break
-                
-            await asyncio.sleep(5)
-            
+                    await subscribe_lots(websocket, payload)
+                except (ValueError, TypeError) as e:
+                    parking_hub.send(websocket, json.dumps({"type": "error", "message": str(e)}))
+            elif message_type == "unsubscribe":
+                unsubscribe_lots(websocket, delta_mode)
+
     except WebSocketDisconnect:
         print("Client deconectat normal")
     except Exception as e:
@@ -283,6 +1618,9 @@ async def websocket_parking(websocket: WebSocket):
             print(f"Eroare neașteptată în WebSocket: {e}")
             traceback.print_exc()
     finally:
+        parking_hub.disconnect(websocket)
+        remove_parking_client(websocket)
+        ws_formats.pop(websocket, None)
         print("🔌 Conexiune WebSocket închisă")
 
 
@@ -294,48 +1632,937 @@ def read_root():
         "endpoints": [
             "/api/v1/parcari (POST - create spot)",
             "/api/v1/parcari/all (GET - recommended)",
-            "/ws/parking (WebSocket live updates)"
+            "/api/v1/parcari?after=&limit= (GET - keyset pagination)",
+            "/api/v1/parcari/stream?after=&format=ndjson|json (GET - streamed list, 503 when STREAM_MAX_CONCURRENT streams are open)",
+            "/api/v1/parcari/import (POST - GeoJSON FeatureCollection or list of lots)",
+            "/api/detection/batch (POST - multiple lots per request)",
+            "/api/v1/parcari/nearby?lat=&lon=&radius=&limit=&only_free= (GET - lots sorted by distance)",
+            "/api/v1/parcari/viewport?min_lat=&min_lon=&max_lat=&max_lon=&only_free= (GET - lots on screen)",
+            "/api/v1/parcari/{parking_number}/history?bucket=minute|hour|day&start=&end= (GET - occupancy history)",
+            "/ws/parking (WebSocket live updates)",
+            "/ws/relay (WebSocket message relay between clients)",
+            "/ws/parking?protocol=delta&since=<version> (WebSocket snapshot + delta updates)",
+            "/ws/parking?protocol=delta&encoding=json|msgpack|binary&compress=deflate (compact frames)",
+            "/ws/parking {type: subscribe, lots: [..]} | {type: subscribe, bbox: [min_lat, min_lon, max_lat, max_lon]} (only these lots)",
+            "/api/v1/zones (GET - free/occupied/total per zone, POST - create zone)",
+            "/ws/zones (WebSocket zone counters: snapshot + changed zones)",
+            "/metrics (GET - Prometheus metrics)"
         ]
     }
 
 
+# Ultima valoare cunoscuta per parcare: camerele trimit aceeasi valoare la fiecare secunda,
+# iar rescrierea ei in DB nu schimba nimic. Intrarile expira ca sa nu mascam modificari facute din alta parte.
+DETECTION_CACHE_TTL = float(os.getenv("DETECTION_CACHE_TTL", "60"))
+last_known_counts: Dict[int, Tuple[dict, float]] = {}
+
+# Starea live avanseaza doar in timpul capturii: per parcare se aplica doar citirea cea mai noua din request
+# si doar daca e mai noua decat cea deja aplicata. Citirile mai vechi (ex. spool-ul unei camere retrimis
+# dupa o pana) ajung doar in istoric, la momentul lor de captura.
+DETECTION_UPDATE_SQL = """
+    UPDATE parking_spots AS ps
+    SET empty_spots = v.free_spots, occupied_spots = ps.total_spots - v.free_spots, detected_at = v.detected_at
+    FROM unnest($1::integer[], $2::integer[], $3::timestamptz[]) AS v(parking_number, free_spots, detected_at)
+    WHERE ps.parking_number = v.parking_number
+      AND (ps.detected_at IS NULL OR ps.detected_at <= v.detected_at)
+    RETURNING ps.parking_number, ps.empty_spots, ps.occupied_spots, ps.total_spots
+"""
+
+DETECTION_LOTS_SQL = """
+    SELECT parking_number, empty_spots, occupied_spots, total_spots
+    FROM parking_spots
+    WHERE parking_number = ANY($1::integer[])
+"""
+
+# Ultimul moment de captura aplicat per parcare, inclusiv citirile neschimbate care nu ajung in DB
+last_detected_at: Dict[int, float] = {}
+
+
+def get_unchanged_detection(parking_number: int, free_spots: int) -> Optional[dict]:
+    entry = last_known_counts.get(parking_number)
+    if entry is None:
+        return None
+    row, stored_at = entry
+    if row["empty_spots"] != free_spots or time.monotonic() - stored_at > DETECTION_CACHE_TTL:
+        return None
+    return row
+
+
+def remember_detection(row: dict):
+    last_known_counts[row["parking_number"]] = (row, time.monotonic())
+    spatial_index.update_counts(row)
+    zone_counters.update_lot(row)
+
+
+def detection_time(item: DetectionData, now: float) -> float:
+    if item.detected_at is None:
+        return now
+    detected_at = item.detected_at
+    if detected_at.tzinfo is None:
+        detected_at = detected_at.replace(tzinfo=timezone.utc)
+    # Ceasul camerei poate fi inaintea serverului; o citire nu poate fi din viitor
+    return min(detected_at.timestamp(), now)
+
+
+async def apply_detections(items: List[DetectionData], query_name: str) -> List[dict]:
+    now = time.time()
+    # Ordine cronologica; la acelasi moment castiga ultima citire din request
+    readings = sorted(((detection_time(item, now), i, item) for i, item in enumerate(items)), key=lambda r: r[:2])
+    newest: Dict[int, Tuple[float, DetectionData]] = {}
+    for ts, _, item in readings:
+        newest[item.parking_number] = (ts, item)
+
+    unchanged = {}
+    pending = []
+    for parking_number, (ts, item) in newest.items():
+        if ts < last_detected_at.get(parking_number, 0):
+            continue
+        cached = get_unchanged_detection(parking_number, item.free_spots)
+        if cached is not None:
+            unchanged[parking_number] = cached
+            last_detected_at[parking_number] = ts
+            detections_received.inc((parking_number, "false"))
+        else:
+            pending.append((parking_number, item.free_spots, datetime.fromtimestamp(ts, timezone.utc)))
+
+    updated = {}
+    if pending:
+        async with db_connection() as conn:
+            with timed(db_query_duration, query_name):
+                rows = await conn.fetch(DETECTION_UPDATE_SQL, *as_columns(pending, 3))
+        updated = {row["parking_number"]: dict(row) for row in rows}
+        for parking_number, row in updated.items():
+            detections_received.inc((parking_number, "true"))
+            remember_detection(row)
+            last_detected_at[parking_number] = newest[parking_number][0]
+        if updated:
+            notify_parking_changed()
+            publish_event("counts", rows=list(updated.values()))
+
+    # Parcarile fara rand live: citiri mai vechi decat starea aplicata (doar istoric) sau parcari inexistente
+    current = {**unchanged, **updated}
+    missing = list(newest.keys() - current.keys())
+    if missing:
+        async with db_connection() as conn:
+            with timed(db_query_duration, "detection_lots"):
+                rows = await conn.fetch(DETECTION_LOTS_SQL, missing)
+        current.update((row["parking_number"], dict(row)) for row in rows)
+
+    applied = {pn: newest[pn][1] for pn in current if pn in updated or pn in unchanged}
+    history_last: Dict[int, Tuple[float, int]] = {}
+    for ts, _, item in readings:
+        parking_number = item.parking_number
+        row = current.get(parking_number)
+        if row is None:
+            continue
+        if applied.get(parking_number) is item:
+            record_occupancy_sample(row, parking_number in updated, ts)
+            continue
+        # Citire doar pentru istoric: valorile repetate se pastreaza tot cel mult o data pe HISTORY_SAMPLE_INTERVAL
+        previous = history_last.get(parking_number)
+        if previous is not None and previous[1] == item.free_spots and ts - previous[0] < HISTORY_SAMPLE_INTERVAL:
+            continue
+        history_last[parking_number] = (ts, item.free_spots)
+        record_occupancy_sample({
+            "parking_number": parking_number,
+            "empty_spots": item.free_spots,
+            "occupied_spots": row["total_spots"] - item.free_spots,
+            "total_spots": row["total_spots"],
+        }, True, ts)
+
+    results = []
+    for item in items:
+        row = current.get(item.parking_number)
+        if row is None:
+            results.append({
+                "parking_number": item.parking_number,
+                "status": "error",
+                "message": f"Parking {item.parking_number} not found!"
+            })
+        else:
+            results.append({
+                "parking_number": item.parking_number,
+                "status": "success",
+                "changed": item.parking_number in updated,
+                "applied": applied.get(item.parking_number) is item,
+                "data": row
+            })
+    return results
+
+
 @app.post("/api/detection")
-def receive_detection(data: DetectionData):
+async def receive_detection(data: DetectionData):
+    try:
+        result = (await apply_detections([data], "detection_update"))[0]
+        if result["status"] == "error":
+            return {"status": "error", "message": result["message"]}
+        return {"status": "success", "changed": result["changed"], "applied": result["applied"], "data": result["data"]}
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+
+
+@app.post("/api/detection/batch")
+async def receive_detection_batch(items: List[DetectionData]):
+    try:
+        return {"status": "success", "results": await apply_detections(items, "detection_batch_update")}
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+
+
+# Paginare keyset + streaming: coordonatele vin din coloana denormalizata ps.polygon (migrations/003),
+# fara join sau GROUP BY, deci fiecare rand se poate trimite imediat ce e citit.
+PARKING_LIST_SQL = """
+    SELECT
+        ps.parking_number,
+        ps.parking_name,
+        ps.empty_spots,
+        ps.occupied_spots,
+        ps.total_spots,
+        ps.price_per_hour,
+        ps.schedule,
+        ps.has_surveillance,
+        ps.has_disabled_access,
+        ps.has_ev_charging,
+        ps.polygon AS coordinates
+    FROM parking_spots ps
+    WHERE ps.parking_number > $1
+    ORDER BY ps.parking_number
+"""
+PARKING_PAGE_MAX = 1000
+STREAM_BATCH_SIZE = 500
+# Fiecare stream tine o conexiune din pool cat citeste clientul; cu prea multe stream-uri lente
+# /api/detection ar astepta DB_POOL_TIMEOUT dupa un slot, asa ca le limitam sub dimensiunea pool-ului
+STREAM_MAX_CONCURRENT = max(1, min(int(os.getenv("STREAM_MAX_CONCURRENT", str(DB_POOL_MAX // 2))), DB_POOL_MAX - 1))
+stream_slots = asyncio.Semaphore(STREAM_MAX_CONCURRENT)
+
+
+@app.get("/api/v1/parcari")
+async def list_parking_page(after: int = 0, limit: int = 100):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT total_spots FROM parking_spots WHERE parking_number = %s", (data.parking_number,))
-        result = cur.fetchone()
-        if not result:
-            cur.close()
-            conn.close()
-            return {"status": "error", "message": f"Parking {data.parking_number} not found!"}
-
-        total_spots = result["total_spots"]
-        occupied_spots = total_spots - data.free_spots
-
-        cur.execute(
-            "UPDATE parking_spots SET empty_spots=%s, occupied_spots=%s WHERE parking_number=%s",
-            (data.free_spots, occupied_spots, data.parking_number)
+        limit = max(1, min(limit, PARKING_PAGE_MAX))
+        async with db_connection() as conn:
+            with timed(db_query_duration, "parking_list"):
+                rows = await conn.fetch(PARKING_LIST_SQL + " LIMIT $2", after, limit)
+        rows = [clean_parking_row(row) for row in rows]
+
+        next_after = rows[-1]["parking_number"] if len(rows) == limit else None
+        return Response(
+            content=dumps_json({"lots": rows, "next_after": next_after}),
+            media_type="application/json"
         )
-        conn.commit()
-        cur.close()
-        conn.close()
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+
+
+async def stream_parking_rows(after: int, ndjson: bool):
+    # Cursor server-side: in memorie stau cel mult STREAM_BATCH_SIZE randuri, oricat de mare e tabela
+    async with stream_slots, db_connection() as conn:
+        async with conn.transaction():
+            if not ndjson:
+                yield b"["
+            first = True
+            encoded = []
+            async for row in conn.cursor(PARKING_LIST_SQL, after, prefetch=STREAM_BATCH_SIZE):
+                encoded.append(dumps_json(clean_parking_row(row)))
+                if len(encoded) < STREAM_BATCH_SIZE:
+                    continue
+                yield encode_stream_chunk(encoded, ndjson, first)
+                first = False
+                encoded = []
+            if encoded:
+                yield encode_stream_chunk(encoded, ndjson, first)
+            if not ndjson:
+                yield b"]"
+
+
+def encode_stream_chunk(encoded: List[bytes], ndjson: bool, first: bool) -> bytes:
+    if ndjson:
+        return b"\n".join(encoded) + b"\n"
+    return (b"" if first else b",") + b",".join(encoded)
+
+
+@app.get("/api/v1/parcari/stream")
+async def stream_parking_data(after: int = 0, format: str = "ndjson"):
+    ndjson = format != "json"
+    if stream_slots.locked():
+        # Toate sloturile sunt ocupate: refuzam imediat in loc sa tinem clientul in asteptare
+        return Response(
+            content=dumps_json({"status": "error", "message": "Prea multe stream-uri active, reincercati"}),
+            status_code=503, media_type="application/json", headers={"Retry-After": "5"}
+        )
+    return StreamingResponse(
+        stream_parking_rows(after, ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json"
+    )
+
+
+# Istoric ocupare: esantioanele se strang in memorie si se scriu in bloc (COPY) de un task separat,
+# ca /api/detection sa nu astepte niciodata dupa insert-uri. Rollup-urile se actualizeaza in aceeasi tranzactie.
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "10"))
+HISTORY_FLUSH_ROWS = int(os.getenv("HISTORY_FLUSH_ROWS", "500"))
+HISTORY_BUFFER_MAX = int(os.getenv("HISTORY_BUFFER_MAX", "100000"))
+HISTORY_SAMPLE_INTERVAL = float(os.getenv("HISTORY_SAMPLE_INTERVAL", "60"))
+# Cat timp se presupune ca o valoare ramane valabila fara un esantion nou (camera cazuta = timp neacoperit)
+HISTORY_MAX_GAP = float(os.getenv("HISTORY_MAX_GAP", "300"))
+HISTORY_BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+HISTORY_DEFAULT_RANGE = {"minute": timedelta(hours=2), "hour": timedelta(days=7), "day": timedelta(days=90)}
+
+history_buffer: List[tuple] = []
+history_lock = threading.Lock()
+history_flush_requested: Optional[asyncio.Event] = None
+last_history_sample: Dict[int, float] = {}
+
+ROLLUP_UPSERT_SQL = """
+    INSERT INTO occupancy_rollups
+        (parking_number, bucket_size, bucket_start, sample_count, min_occupied, max_occupied, sum_occupied, total_spots,
+         occupied_seconds, covered_seconds)
+    SELECT * FROM unnest(
+        $1::integer[], $2::varchar[], $3::timestamptz[], $4::integer[],
+        $5::integer[], $6::integer[], $7::integer[], $8::integer[],
+        $9::float8[], $10::float8[]
+    )
+    ON CONFLICT (parking_number, bucket_size, bucket_start) DO UPDATE SET
+        sample_count = occupancy_rollups.sample_count + EXCLUDED.sample_count,
+        min_occupied = CASE WHEN EXCLUDED.sample_count = 0 THEN occupancy_rollups.min_occupied
+                            WHEN occupancy_rollups.sample_count = 0 THEN EXCLUDED.min_occupied
+                            ELSE LEAST(occupancy_rollups.min_occupied, EXCLUDED.min_occupied) END,
+        max_occupied = CASE WHEN EXCLUDED.sample_count = 0 THEN occupancy_rollups.max_occupied
+                            WHEN occupancy_rollups.sample_count = 0 THEN EXCLUDED.max_occupied
+                            ELSE GREATEST(occupancy_rollups.max_occupied, EXCLUDED.max_occupied) END,
+        sum_occupied = occupancy_rollups.sum_occupied + EXCLUDED.sum_occupied,
+        total_spots = EXCLUDED.total_spots,
+        occupied_seconds = occupancy_rollups.occupied_seconds + EXCLUDED.occupied_seconds,
+        covered_seconds = occupancy_rollups.covered_seconds + EXCLUDED.covered_seconds
+"""
+
+# Flush-urile pe aceeasi parcare (si de pe alte instante) se serializeaza, ca lantul de esantioane sa fie consistent
+HISTORY_LOCK_SQL = """
+    SELECT pg_advisory_xact_lock(hashtext('occupancy_history'), n) FROM unnest($1::integer[]) AS n
+"""
+
+# Esantioanele deja salvate care se invecineaza cu lotul nou: ultimul dinainte, cele din interval, primul de dupa
+HISTORY_NEIGHBOURS_SQL = """
+    SELECT b.parking_number, s.recorded_at, s.occupied_spots, s.total_spots
+    FROM unnest($1::integer[], $2::timestamptz[], $3::timestamptz[]) AS b(parking_number, first_at, last_at)
+    CROSS JOIN LATERAL (
+        (SELECT recorded_at, occupied_spots, total_spots FROM occupancy_samples
+         WHERE parking_number = b.parking_number AND recorded_at < b.first_at
+         ORDER BY recorded_at DESC LIMIT 1)
+        UNION ALL
+        (SELECT recorded_at, occupied_spots, total_spots FROM occupancy_samples
+         WHERE parking_number = b.parking_number AND recorded_at BETWEEN b.first_at AND b.last_at)
+        UNION ALL
+        (SELECT recorded_at, occupied_spots, total_spots FROM occupancy_samples
+         WHERE parking_number = b.parking_number AND recorded_at > b.last_at
+         ORDER BY recorded_at LIMIT 1)
+    ) AS s
+"""
+
+
+def record_occupancy_sample(row: dict, changed: bool, recorded_at: Optional[float] = None):
+    # Valorile neschimbate se pastreaza cel mult o data pe HISTORY_SAMPLE_INTERVAL, ca rollup-urile sa nu aiba goluri.
+    # recorded_at = momentul capturii; citirile retrimise mai tarziu ajung in bucket-ul in care au fost facute
+    ts = time.time() if recorded_at is None else recorded_at
+    parking_number = row["parking_number"]
+    last_sample = last_history_sample.get(parking_number, 0)
+    if not changed and ts - last_sample < HISTORY_SAMPLE_INTERVAL:
+        return
+    last_history_sample[parking_number] = max(last_sample, ts)
+
+    with history_lock:
+        history_buffer.append(
+            (parking_number, ts, row["empty_spots"], row["occupied_spots"], row["total_spots"])
+        )
+        if len(history_buffer) > HISTORY_BUFFER_MAX:
+            del history_buffer[:len(history_buffer) - HISTORY_BUFFER_MAX]
+        full = len(history_buffer) >= HISTORY_FLUSH_ROWS
+
+    if full and broadcast_loop is not None and history_flush_requested is not None:
+        broadcast_loop.call_soon_threadsafe(history_flush_requested.set)
+
+
+def rollup_entry(rollups: Dict[tuple, list], key: tuple, occupied: int, total: int) -> list:
+    # [sample_count, min, max, sum, total, occupied_seconds, covered_seconds]
+    # min/max vin doar din esantioanele din bucket; un bucket fara esantioane e acoperit de o singura valoare
+    current = rollups.get(key)
+    if current is None:
+        current = rollups[key] = [0, occupied, occupied, 0, total, 0.0, 0.0]
+    return current
+
+
+def history_segments(chain: List[tuple]) -> List[tuple]:
+    # Fiecare esantion (ts, occupied, total) e valabil pana la urmatorul, dar cel mult HISTORY_MAX_GAP
+    return [
+        (a[0], a[0] + min(b[0] - a[0], HISTORY_MAX_GAP), a[1], a[2])
+        for a, b in zip(chain, chain[1:])
+        if b[0] > a[0]
+    ]
+
+
+def build_rollups(samples: List[tuple], existing: List[tuple] = ()) -> List[tuple]:
+    rollups: Dict[tuple, list] = {}
+    for parking_number, ts, _, occupied, total in samples:
+        for bucket_size, seconds in HISTORY_BUCKETS.items():
+            current = rollup_entry(rollups, (parking_number, bucket_size, ts - ts % seconds), occupied, total)
+            current[1] = min(current[1], occupied)
+            current[2] = max(current[2], occupied)
+            current[0] += 1
+            current[3] += occupied
+            current[4] = total
+
+    # Ponderare in timp: existing = esantioanele salvate vecine cu lotul (parking_number, ts, occupied, total).
+    # Se adauga segmentele lantului nou si se scad cele ale lantului vechi, pe care un esantion intarziat le poate rupe.
+    old_chains: Dict[int, List[tuple]] = {}
+    for parking_number, ts, occupied, total in existing:
+        old_chains.setdefault(parking_number, []).append((ts, occupied, total))
+    new_chains = {parking_number: list(chain) for parking_number, chain in old_chains.items()}
+    for parking_number, ts, _, occupied, total in samples:
+        new_chains.setdefault(parking_number, []).append((ts, occupied, total))
+
+    for parking_number, chain in new_chains.items():
+        chain.sort(key=lambda sample: sample[0])
+        old_chain = sorted(old_chains.get(parking_number, []), key=lambda sample: sample[0])
+        for sign, segments in ((1, history_segments(chain)), (-1, history_segments(old_chain))):
+            for start, end, occupied, total in segments:
+                for bucket_size, seconds in HISTORY_BUCKETS.items():
+                    bucket = start - start % seconds
+                    while bucket < end:
+                        overlap = min(end, bucket + seconds) - max(start, bucket)
+                        current = rollup_entry(rollups, (parking_number, bucket_size, bucket), occupied, total)
+                        current[5] += sign * occupied * overlap
+                        current[6] += sign * overlap
+                        bucket += seconds
+
+    return [
+        (parking_number, bucket_size, datetime.fromtimestamp(start, timezone.utc), *values)
+        for (parking_number, bucket_size, start), values in rollups.items()
+    ]
+
+
+async def flush_occupancy_history() -> int:
+    with history_lock:
+        samples = history_buffer[:]
+        history_buffer.clear()
+    if not samples:
+        return 0
+
+    try:
+        records = [
+            (parking_number, datetime.fromtimestamp(ts, timezone.utc), empty, occupied, total)
+            for parking_number, ts, empty, occupied, total in samples
+        ]
+        ranges: Dict[int, list] = {}
+        for parking_number, ts, *_ in samples:
+            current = ranges.setdefault(parking_number, [ts, ts])
+            current[0] = min(current[0], ts)
+            current[1] = max(current[1], ts)
+        lots = sorted(ranges)
+        async with db_connection() as conn:
+            async with conn.transaction():
+                await conn.execute(HISTORY_LOCK_SQL, lots)
+                with timed(db_query_duration, "history_neighbours"):
+                    neighbours = await conn.fetch(
+                        HISTORY_NEIGHBOURS_SQL,
+                        lots,
+                        [datetime.fromtimestamp(ranges[n][0], timezone.utc) for n in lots],
+                        [datetime.fromtimestamp(ranges[n][1], timezone.utc) for n in lots]
+                    )
+                existing = [
+                    (row["parking_number"], row["recorded_at"].timestamp(), row["occupied_spots"], row["total_spots"])
+                    for row in neighbours
+                ]
+                with timed(db_query_duration, "history_copy_samples"):
+                    await conn.copy_records_to_table(
+                        "occupancy_samples",
+                        records=records,
+                        columns=["parking_number", "recorded_at", "empty_spots", "occupied_spots", "total_spots"]
+                    )
+                with timed(db_query_duration, "history_upsert_rollups"):
+                    await conn.execute(ROLLUP_UPSERT_SQL, *as_columns(build_rollups(samples, existing), 10))
+    except Exception:
+        # Punem esantioanele inapoi in fata bufferului, in ordine, pentru urmatoarea incercare
+        with history_lock:
+            history_buffer[:0] = samples
+            if len(history_buffer) > HISTORY_BUFFER_MAX:
+                del history_buffer[:len(history_buffer) - HISTORY_BUFFER_MAX]
+        raise
+
+    return len(samples)
+
+
+async def occupancy_history_flusher():
+    while True:
+        try:
+            await asyncio.wait_for(history_flush_requested.wait(), timeout=HISTORY_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        history_flush_requested.clear()
+
+        try:
+            await flush_occupancy_history()
+        except Exception as e:
+            print(f"Eroare la salvarea istoricului: {e}")
+            traceback.print_exc()
+
+
+@app.get("/api/v1/parcari/{parking_number}/history")
+async def get_parking_history(
+    parking_number: int,
+    bucket: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    try:
+        if bucket not in HISTORY_BUCKETS:
+            return {"status": "error", "message": f"Bucket invalid: {bucket} (minute, hour sau day)"}
+
+        end = end or datetime.now(timezone.utc)
+        start = start or end - HISTORY_DEFAULT_RANGE[bucket]
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+
+        async with db_connection() as conn:
+            with timed(db_query_duration, "history_rollups"):
+                rows = await conn.fetch(
+                    """
+                    SELECT bucket_start, sample_count, min_occupied, max_occupied, covered_seconds,
+                           CASE WHEN covered_seconds > 0 THEN occupied_seconds / covered_seconds
+                                ELSE sum_occupied::float / NULLIF(sample_count, 0) END AS avg_occupied,
+                           total_spots
+                    FROM occupancy_rollups
+                    WHERE parking_number = $1 AND bucket_size = $2 AND bucket_start >= $3 AND bucket_start < $4
+                      AND (sample_count > 0 OR covered_seconds > 0)
+                    ORDER BY bucket_start
+                    """,
+                    parking_number, bucket, start, end
+                )
 
         return {
             "status": "success",
-            "data": {
-                "parking_number": data.parking_number,
-                "empty_spots": data.free_spots,
-                "occupied_spots": occupied_spots,
-                "total_spots": total_spots
-            }
+            "parking_number": parking_number,
+            "bucket": bucket,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "buckets": [
+                {
+                    "bucket_start": row["bucket_start"].isoformat(),
+                    "samples": row["sample_count"],
+                    "min_occupied": row["min_occupied"] if row["sample_count"] else round(row["avg_occupied"]),
+                    "avg_occupied": round(row["avg_occupied"], 2),
+                    "max_occupied": row["max_occupied"] if row["sample_count"] else round(row["avg_occupied"]),
+                    "covered_seconds": round(row["covered_seconds"]),
+                    "total_spots": row["total_spots"]
+                }
+                for row in rows
+            ]
         }
     except Exception as e:
         traceback.print_exc()
         return {"status": "error", "message": str(e)}
 
 
+# Index spatial in memorie (grid pe lat/lon): fiecare parcare e pusa in toate celulele atinse de bbox-ul ei
+SPATIAL_CELL_DEGREES = float(os.getenv("SPATIAL_CELL_DEGREES", "0.01"))
+EARTH_RADIUS_M = 6371000
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class GridSpatialIndex:
+    def __init__(self, cell_degrees: float):
+        self.cell_degrees = cell_degrees
+        self.loaded = False
+        self._lots: Dict[int, dict] = {}
+        self._geometry: Dict[int, tuple] = {}
+        self._cells: Dict[Tuple[int, int], set] = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def _cells_for_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        lat0, lon0 = self._cell(min_lat, min_lon)
+        lat1, lon1 = self._cell(max_lat, max_lon)
+        for i in range(lat0, lat1 + 1):
+            for j in range(lon0, lon1 + 1):
+                yield i, j
+
+    def _insert(self, lot: dict):
+        coords = lot.get("coordinates") or []
+        if not coords:
+            return
+        lats = [c["latitude"] for c in coords]
+        lons = [c["longitude"] for c in coords]
+        bbox = (min(lats), min(lons), max(lats), max(lons))
+        centroid = (sum(lats) / len(lats), sum(lons) / len(lons))
+
+        parking_number = lot["parking_number"]
+        self._remove(parking_number)
+        self._lots[parking_number] = lot
+        self._geometry[parking_number] = (bbox, centroid)
+        for cell in self._cells_for_bbox(*bbox):
+            self._cells.setdefault(cell, set()).add(parking_number)
+
+    def _remove(self, parking_number: int):
+        geometry = self._geometry.pop(parking_number, None)
+        self._lots.pop(parking_number, None)
+        if geometry is None:
+            return
+        for cell in self._cells_for_bbox(*geometry[0]):
+            members = self._cells.get(cell)
+            if members is not None:
+                members.discard(parking_number)
+                if not members:
+                    del self._cells[cell]
+
+    def rebuild(self, lots: List[dict]):
+        with self._lock:
+            self._lots, self._geometry, self._cells = {}, {}, {}
+            for lot in lots:
+                self._insert(lot)
+            self.loaded = True
+
+    def add(self, lot: dict):
+        with self._lock:
+            self._insert(lot)
+
+    def update_counts(self, row: dict):
+        lot = self._lots.get(row["parking_number"])
+        if lot is not None:
+            lot["empty_spots"] = row["empty_spots"]
+            lot["occupied_spots"] = row["occupied_spots"]
+            lot["total_spots"] = row["total_spots"]
+
+    def _query(self, min_lat, min_lon, max_lat, max_lon, lat, lon, only_free, max_distance=None):
+        with self._lock:
+            lat0, lon0 = self._cell(min_lat, min_lon)
+            lat1, lon1 = self._cell(max_lat, max_lon)
+            if (lat1 - lat0 + 1) * (lon1 - lon0 + 1) > len(self._cells):
+                # Viewport mai mare decat harta indexata: mai ieftin sa verificam direct toate parcarile
+                candidates = set(self._geometry)
+            else:
+                candidates = set()
+                for cell in self._cells_for_bbox(min_lat, min_lon, max_lat, max_lon):
+                    candidates.update(self._cells.get(cell, ()))
+
+            results = []
+            for parking_number in candidates:
+                (b_min_lat, b_min_lon, b_max_lat, b_max_lon), centroid = self._geometry[parking_number]
+                if b_max_lat < min_lat or b_min_lat > max_lat or b_max_lon < min_lon or b_min_lon > max_lon:
+                    continue
+                lot = self._lots[parking_number]
+                if only_free and lot["empty_spots"] <= 0:
+                    continue
+                distance = haversine_m(lat, lon, centroid[0], centroid[1])
+                if max_distance is not None and distance > max_distance:
+                    continue
+                results.append((distance, lot))
+
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def nearby(self, lat: float, lon: float, radius_m: float, limit: int, only_free: bool = False):
+        dlat = radius_m / 111320
+        dlon = radius_m / (111320 * max(math.cos(math.radians(lat)), 1e-6))
+        results = self._query(lat - dlat, lon - dlon, lat + dlat, lon + dlon, lat, lon, only_free, radius_m)
+        return results[:limit]
+
+    def viewport(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                 limit: int, only_free: bool = False):
+        center_lat, center_lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+        results = self._query(min_lat, min_lon, max_lat, max_lon, center_lat, center_lon, only_free)
+        return results[:limit]
+
+
+spatial_index = GridSpatialIndex(SPATIAL_CELL_DEGREES)
+
+
+async def load_spatial_index():
+    try:
+        async with AsyncSession(engine) as session:
+            spatial_index.rebuild(await build_all_parking_data(session))
+        print(f"Index spatial construit: {len(spatial_index._lots)} parcari")
+    except Exception as e:
+        print(f"Eroare la construirea indexului spatial: {e}")
+        traceback.print_exc()
+
+
+async def ensure_spatial_index():
+    if not spatial_index.loaded:
+        await load_spatial_index()
+
+
+def spatial_results(results):
+    return [{**lot, "distance_m": round(distance, 1)} for distance, lot in results]
+
+
+@app.get("/api/v1/parcari/nearby")
+async def get_nearby_parking(lat: float, lon: float, radius: float = 1000, limit: int = 50, only_free: bool = False):
+    try:
+        await ensure_spatial_index()
+        return spatial_results(spatial_index.nearby(lat, lon, radius, limit, only_free))
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+
+
+@app.get("/api/v1/parcari/viewport")
+async def get_viewport_parking(
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+    limit: int = 500,
+    only_free: bool = False
+):
+    try:
+        await ensure_spatial_index()
+        return spatial_results(spatial_index.viewport(min_lat, min_lon, max_lat, max_lon, limit, only_free))
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+
+
+# Zone cu contoare agregate (libere/ocupate/total). Contoarele se actualizeaza incremental la fiecare
+# detectie: diferenta fata de valoarea anterioara a parcarii se aplica doar zonelor din care face parte.
+def point_in_polygon(lat: float, lon: float, polygon: List[Tuple[float, float]]) -> bool:
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lon_i = polygon[i]
+        lat_j, lon_j = polygon[j]
+        if (lon_i > lon) != (lon_j > lon) and lat < (lat_j - lat_i) * (lon - lon_i) / (lon_j - lon_i) + lat_i:
+            inside = not inside
+        j = i
+    return inside
+
+
+def lot_centroid(coordinates: List[dict]) -> Optional[Tuple[float, float]]:
+    if not coordinates:
+        return None
+    return (
+        sum(c["latitude"] for c in coordinates) / len(coordinates),
+        sum(c["longitude"] for c in coordinates) / len(coordinates),
+    )
+
+
+class ZoneCounters:
+    def __init__(self):
+        self.loaded = False
+        self.zones: Dict[int, dict] = {}
+        self.dirty: Set[int] = set()
+        self._members: Dict[int, Optional[Set[int]]] = {}
+        self._polygons: Dict[int, List[Tuple[float, float]]] = {}
+        self._lot_zones: Dict[int, List[int]] = {}
+        self._lot_counts: Dict[int, Tuple[int, int, int]] = {}
+        self._lot_centroids: Dict[int, Optional[Tuple[float, float]]] = {}
+
+    def _contains(self, zone_id: int, parking_number: int) -> bool:
+        members = self._members.get(zone_id)
+        if members is not None:
+            return parking_number in members
+        centroid = self._lot_centroids.get(parking_number)
+        return centroid is not None and point_in_polygon(centroid[0], centroid[1], self._polygons[zone_id])
+
+    def _join(self, zone_id: int, parking_number: int):
+        empty, occupied, total = self._lot_counts[parking_number]
+        zone = self.zones[zone_id]
+        zone["empty_spots"] += empty
+        zone["occupied_spots"] += occupied
+        zone["total_spots"] += total
+        zone["lots"] += 1
+        self._lot_zones.setdefault(parking_number, []).append(zone_id)
+        self.dirty.add(zone_id)
+
+    def add_zone(self, zone_id: int, name: str, parking_numbers: Optional[List[int]], polygon: Optional[bytes]):
+        self.zones[zone_id] = {
+            "zone_id": zone_id, "name": name, "empty_spots": 0, "occupied_spots": 0, "total_spots": 0, "lots": 0
+        }
+        if parking_numbers is not None:
+            self._members[zone_id] = set(parking_numbers)
+        else:
+            self._members[zone_id] = None
+            self._polygons[zone_id] = [(c["latitude"], c["longitude"]) for c in unpack_polygon(polygon)]
+        # Scanare completa doar la crearea zonei, nu pe hot path
+        for parking_number in self._lot_counts:
+            if self._contains(zone_id, parking_number):
+                self._join(zone_id, parking_number)
+
+    def add_lot(self, lot: dict, centroid: Optional[Tuple[float, float]] = None):
+        parking_number = lot["parking_number"]
+        if parking_number in self._lot_counts:
+            self.update_lot(lot)
+            return
+        self._lot_counts[parking_number] = (lot["empty_spots"], lot["occupied_spots"], lot["total_spots"])
+        self._lot_centroids[parking_number] = centroid or lot_centroid(lot.get("coordinates") or [])
+        for zone_id in self.zones:
+            if self._contains(zone_id, parking_number):
+                self._join(zone_id, parking_number)
+
+    def update_lot(self, row: dict):
+        parking_number = row["parking_number"]
+        previous = self._lot_counts.get(parking_number)
+        if previous is None:
+            return
+        current = (row["empty_spots"], row["occupied_spots"], row["total_spots"])
+        if current == previous:
+            return
+        self._lot_counts[parking_number] = current
+        for zone_id in self._lot_zones.get(parking_number, ()):
+            zone = self.zones[zone_id]
+            zone["empty_spots"] += current[0] - previous[0]
+            zone["occupied_spots"] += current[1] - previous[1]
+            zone["total_spots"] += current[2] - previous[2]
+            self.dirty.add(zone_id)
+
+    def rebuild(self, zones: List[tuple], lots: List[tuple]):
+        self.__init__()
+        for parking_number, empty, occupied, total, centroid_lat, centroid_lon in lots:
+            centroid = (centroid_lat, centroid_lon) if centroid_lat is not None else None
+            lot = {"parking_number": parking_number, "empty_spots": empty, "occupied_spots": occupied, "total_spots": total}
+            self.add_lot(lot, centroid)
+        for zone_id, name, parking_numbers, polygon in zones:
+            self.add_zone(zone_id, name, parking_numbers, polygon)
+        self.dirty.clear()
+        self.loaded = True
+
+    def snapshot(self) -> List[dict]:
+        return [dict(zone) for _, zone in sorted(self.zones.items())]
+
+
+zone_counters = ZoneCounters()
+zone_subscribers: List[WebSocket] = []
+
+
+def remove_zone_client(websocket: WebSocket):
+    if websocket in zone_subscribers:
+        zone_subscribers.remove(websocket)
+
+
+# zones_delta contine doar zonele schimbate, deci nici aici nu aruncam mesaje: clientul lent e deconectat
+zones_hub = BroadcastHub("zones", PARKING_QUEUE_SIZE, "disconnect", PARKING_SEND_TIMEOUT, remove_zone_client)
+
+
+async def load_zone_counters():
+    try:
+        async with db_connection() as conn:
+            with timed(db_query_duration, "zones"):
+                zones = await conn.fetch("SELECT zone_id, name, parking_numbers, polygon FROM zones")
+            with timed(db_query_duration, "zone_lot_counts"):
+                lots = await conn.fetch(
+                    "SELECT parking_number, empty_spots, occupied_spots, total_spots, centroid_lat, centroid_lon "
+                    "FROM parking_spots"
+                )
+        zone_counters.rebuild([tuple(row) for row in zones], [tuple(row) for row in lots])
+        print(f"Zone incarcate: {len(zone_counters.zones)}")
+    except Exception as e:
+        print(f"Eroare la incarcarea zonelor: {e}")
+        traceback.print_exc()
+
+
+async def ensure_zone_counters():
+    if not zone_counters.loaded:
+        await load_zone_counters()
+
+
+def broadcast_zone_changes():
+    if not zone_counters.dirty:
+        return
+    changed = [dict(zone_counters.zones[zone_id]) for zone_id in sorted(zone_counters.dirty)]
+    zone_counters.dirty.clear()
+    if not zone_subscribers:
+        return
+    frame = Frame("zones_delta", {"type": "zones_delta", "zones": changed})
+    send_to_subscribers(zones_hub, {ws: frame for ws in zone_subscribers}, "zones")
+
+
+@app.get("/api/v1/zones")
+async def get_zones():
+    try:
+        await ensure_zone_counters()
+        return zone_counters.snapshot()
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+
+
+@app.post("/api/v1/zones", status_code=201)
+async def create_zone(zone_data: ZoneCreate):
+    try:
+        if (zone_data.parking_numbers is None) == (zone_data.coordinates is None):
+            return {"status": "error", "message": "Zona are nevoie fie de parking_numbers, fie de coordinates"}
+        if zone_data.coordinates is not None and len(zone_data.coordinates) < 3:
+            return {"status": "error", "message": "Poligonul zonei are nevoie de cel putin 3 puncte"}
+
+        polygon = pack_polygon(zone_data.coordinates)["polygon"] if zone_data.coordinates is not None else None
+        await ensure_zone_counters()
+        async with db_connection() as conn:
+            with timed(db_query_duration, "create_zone"):
+                zone_id = await conn.fetchval(
+                    "INSERT INTO zones (name, parking_numbers, polygon) VALUES ($1, $2, $3) RETURNING zone_id",
+                    zone_data.name, zone_data.parking_numbers, polygon
+                )
+        zone_counters.add_zone(zone_id, zone_data.name, zone_data.parking_numbers, polygon)
+        # Parcarile nu s-au schimbat (cache-ul /all ramane valid), doar trezim broadcaster-ul pentru zone
+        if parking_changed is not None:
+            parking_changed.set()
+        publish_event("structure")
+        return {"status": "success", "zone": dict(zone_counters.zones[zone_id])}
+    except asyncpg.UniqueViolationError:
+        return {"status": "error", "message": f"Exista deja o zona cu numele {zone_data.name}"}
+    except Exception as e:
+        traceback.print_exc()
+        return {"status": "error", "message": str(e)}
+
+
+@app.websocket("/ws/zones")
+async def websocket_zones(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        ws_formats[websocket] = parse_ws_format(websocket, delta_mode=False)
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=1003)
+        return
+
+    zones_hub.connect(websocket)
+    try:
+        await ensure_zone_counters()
+        zone_subscribers.append(websocket)
+        zones_hub.send(websocket, Frame("zones", {"type": "zones", "zones": zone_counters.snapshot()}))
+        while True:
+            message = await websocket.receive_text()
+            try:
+                payload = json.loads(message)
+            except ValueError:
+                continue
+            if isinstance(payload, dict) and payload.get("type") == "ping":
+                zones_hub.send(websocket, json.dumps({"type": "pong"}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        zones_hub.disconnect(websocket)
+        remove_zone_client(websocket)
+        ws_formats.pop(websocket, None)
+
+
+# Cu mai multi workeri fiecare proces importa modulul separat; evenimentele trec prin PUBSUB_BACKEND
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if API_WORKERS > 1 and PUBSUB_BACKEND == "memory":
+        print("ATENTIE: PUBSUB_BACKEND=memory nu propaga evenimentele intre workeri")
+    uvicorn.run("api:app", host="0.0.0.0", port=8000, workers=API_WORKERS)
\ No newline at end of file
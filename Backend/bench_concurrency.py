@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+import httpx
+import uvicorn
+import websockets
+
+import api
+
+BENCH_PREFIX = "bench-conc-"
+
+
+def start_server(port):
+    config = uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(label, values, unit="ms"):
+    print(f"{label:<20} n={len(values):6d}  p50={percentile(values, 0.50):7.2f} {unit}  "
+          f"p95={percentile(values, 0.95):7.2f} {unit}  p99={percentile(values, 0.99):7.2f} {unit}  "
+          f"max={max(values, default=0):7.2f} {unit}")
+
+
+async def create_lots(client, lots, prefix=BENCH_PREFIX, total_spots=20):
+    payload = [
+        {
+            "parking_name": f"{prefix}{i}",
+            "empty_spots": total_spots,
+            "occupied_spots": 0,
+            "total_spots": total_spots,
+            "coordinates": [
+                {"latitude": 45.75 + i / 10000, "longitude": 21.22 + order / 10000, "point_order": order}
+                for order in range(4)
+            ]
+        }
+        for i in range(lots)
+    ]
+    response = await client.post("/api/v1/parcari/import", json=payload, timeout=60)
+    result = response.json()
+    if result.get("status") != "success":
+        raise RuntimeError(f"Import esuat: {result}")
+    return [item["parking_number"] for item in result["created"]]
+
+
+async def cleanup(prefix=BENCH_PREFIX):
+    conn = await api.get_db_connection()
+    try:
+        async with conn.transaction():
+            for table in ("occupancy_samples", "occupancy_rollups", "parking_coordinates"):
+                await conn.execute(
+                    f"DELETE FROM {table} WHERE parking_number IN "
+                    "(SELECT parking_number FROM parking_spots WHERE parking_name LIKE $1)",
+                    f"{prefix}%"
+                )
+            await conn.execute("DELETE FROM parking_spots WHERE parking_name LIKE $1", f"{prefix}%")
+    finally:
+        await conn.close()
+
+
+async def ws_listener(url, stop, frames):
+    async with websockets.connect(url, max_size=None) as ws:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(ws.recv(), timeout=0.5)
+                frames[0] += 1
+            except asyncio.TimeoutError:
+                continue
+
+
+async def ping_probe(url, stop, rtts, interval):
+    # Masoara cat de repede raspunde bucla de evenimente a serverului pe un WebSocket deschis
+    async with websockets.connect(url, max_size=None) as ws:
+        while not stop.is_set():
+            start = time.perf_counter()
+            await ws.send(json.dumps({"type": "ping"}))
+            while True:
+                message = json.loads(await ws.recv())
+                if isinstance(message, dict) and message.get("type") == "pong":
+                    break
+            rtts.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(interval)
+
+
+async def detection_poster(client, lot_ids, stop, latencies, failures):
+    while not stop.is_set():
+        parking_number = random.choice(lot_ids)
+        payload = {"parking_number": parking_number, "free_spots": random.randint(0, 20), "total_spots": 20}
+        start = time.perf_counter()
+        response = await client.post("/api/detection", json=payload)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.json().get("status") != "success":
+            failures[0] += 1
+
+
+async def run_phase(base_url, ws_url, lot_ids, args, with_load):
+    stop = asyncio.Event()
+    frames, failures = [0], [0]
+    rtts, latencies = [], []
+
+    limits = httpx.Limits(max_connections=args.posters, max_keepalive_connections=args.posters)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        tasks = [asyncio.create_task(ws_listener(ws_url, stop, frames)) for _ in range(args.ws_clients)]
+        tasks.append(asyncio.create_task(ping_probe(ws_url, stop, rtts, args.ping_interval)))
+        if with_load:
+            tasks += [
+                asyncio.create_task(detection_poster(client, lot_ids, stop, latencies, failures))
+                for _ in range(args.posters)
+            ]
+
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return rtts, latencies, frames[0], failures[0]
+
+
+async def run(args):
+    base_url = f"http://127.0.0.1:{args.port}"
+    ws_url = f"ws://127.0.0.1:{args.port}/ws/parking"
+
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        lot_ids = await create_lots(client, args.lots)
+
+    idle_rtts, _, _, _ = await run_phase(base_url, ws_url, lot_ids, args, with_load=False)
+    rtts, latencies, frames, failures = await run_phase(base_url, ws_url, lot_ids, args, with_load=True)
+
+    print(f"{args.ws_clients} clienti WebSocket, {args.posters} posteri concurenti, {args.duration}s")
+    report("ping idle", idle_rtts)
+    report("ping sub incarcare", rtts)
+    report("POST /api/detection", latencies)
+    print(f"detectii/s={len(latencies) / args.duration:8.1f}  esuate={failures}  "
+          f"frame-uri WebSocket primite={frames}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Clienti WebSocket si POST /api/detection concurente: verifica ca nu se blocheaza reciproc"
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--lots", type=int, default=50)
+    parser.add_argument("--ws-clients", type=int, default=50)
+    parser.add_argument("--posters", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--ping-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    api.engine.echo = False
+    server, thread = start_server(args.port)
+    try:
+        asyncio.run(run(args))
+    finally:
+        # Serverul isi salveaza istoricul la oprire, deci stergem parcarile de test abia dupa
+        server.should_exit = True
+        thread.join()
+        asyncio.run(cleanup())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import statistics
+import time
+from contextlib import asynccontextmanager
+
+from fastapi.testclient import TestClient
+
+import api
+
+
+@asynccontextmanager
+async def unpooled_connection():
+    # Comportamentul vechi: conexiune noua (TLS + auth) pentru fiecare request
+    conn = await api.get_db_connection()
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+def run(client, parking_number, total_spots, iterations):
+    latencies = []
+    for i in range(iterations):
+        payload = {
+            "parking_number": parking_number,
+            "free_spots": i % (total_spots + 1),
+            "total_spots": total_spots,
+        }
+        start = time.perf_counter()
+        response = client.post("/api/detection", json=payload)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.json().get("status") != "success":
+            raise RuntimeError(f"Detectie esuata: {response.text}")
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<10} mean={statistics.mean(latencies):7.2f} ms  "
+          f"p50={statistics.median(latencies):7.2f} ms  p95={p95:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenta POST /api/detection cu si fara pool de conexiuni")
+    parser.add_argument("--parking-number", type=int, required=True)
+    parser.add_argument("--total-spots", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    api.engine.echo = False
+    pooled_connection = api.db_connection
+
+    with TestClient(api.app) as client:
+        api.db_connection = unpooled_connection
+        before = run(client, args.parking_number, args.total_spots, args.iterations)
+
+        api.db_connection = pooled_connection
+        run(client, args.parking_number, args.total_spots, 5)
+        after = run(client, args.parking_number, args.total_spots, args.iterations)
+
+    report("unpooled", before)
+    report("pooled", after)
+
+
+if __name__ == "__main__":
+    main()
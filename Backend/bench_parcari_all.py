@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from sqlalchemy import create_engine, event
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import api
+
+BENCH_PREFIX = "bench-"
+
+
+async def seed(lots, coords_per_lot):
+    async with api.db_connection() as conn:
+        async with conn.transaction():
+            ids = [
+                row["parking_number"] for row in await conn.fetch(
+                    "INSERT INTO parking_spots (parking_name, empty_spots, occupied_spots, total_spots, "
+                    "has_surveillance, has_disabled_access, has_ev_charging) "
+                    "SELECT $1 || i, 10, 10, 20, true, true, true FROM generate_series(1, $2) AS i "
+                    "RETURNING parking_number",
+                    BENCH_PREFIX, lots
+                )
+            ]
+            coord_rows, geometry_rows = [], []
+            for parking_number in ids:
+                lat, lon = 45.75 + random.random() / 10, 21.22 + random.random() / 10
+                # Ordine inversata intentionat, ca sortarea sa nu fie gratuita
+                coords = [
+                    api.ParkingCoordinateIn(latitude=lat + order / 10000, longitude=lon, point_order=order)
+                    for order in reversed(range(coords_per_lot))
+                ]
+                coord_rows.extend((c.latitude, c.longitude, c.point_order, parking_number) for c in coords)
+                geometry = api.pack_polygon(coords)
+                geometry_rows.append((parking_number, *(geometry[column] for column in api.GEOMETRY_COLUMNS)))
+            await conn.copy_records_to_table(
+                "parking_coordinates",
+                records=coord_rows,
+                columns=["latitude", "longitude", "point_order", "parking_number"]
+            )
+            await conn.executemany(
+                "UPDATE parking_spots SET "
+                + ", ".join(f"{column} = ${i}" for i, column in enumerate(api.GEOMETRY_COLUMNS, start=2))
+                + " WHERE parking_number = $1",
+                geometry_rows
+            )
+
+
+async def cleanup():
+    async with api.db_connection() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "DELETE FROM parking_coordinates WHERE parking_number IN "
+                "(SELECT parking_number FROM parking_spots WHERE parking_name LIKE $1)",
+                f"{BENCH_PREFIX}%"
+            )
+            await conn.execute("DELETE FROM parking_spots WHERE parking_name LIKE $1", f"{BENCH_PREFIX}%")
+
+
+def legacy_build(session):
+    # Implementarea initiala: lazy load pe fiecare parcare + sortare in Python
+    final_results = []
+    for spot in session.exec(select(api.ParkingSpot)).all():
+        spot.coordinates.sort(key=lambda coord: coord.point_order)
+        final_results.append({
+            "parking_number": spot.parking_number,
+            "parking_name": spot.parking_name,
+            "empty_spots": spot.empty_spots,
+            "occupied_spots": spot.occupied_spots,
+            "total_spots": spot.total_spots,
+            "price_per_hour": float(spot.price_per_hour) if spot.price_per_hour is not None else None,
+            "schedule": spot.schedule,
+            "has_surveillance": spot.has_surveillance,
+            "has_disabled_access": spot.has_disabled_access,
+            "has_ev_charging": spot.has_ev_charging,
+            "coordinates": [
+                {"latitude": float(c.latitude), "longitude": float(c.longitude), "point_order": c.point_order}
+                for c in spot.coordinates
+            ]
+        })
+    return json.dumps(final_results).encode()
+
+
+async def current_build():
+    async with AsyncSession(api.engine) as session:
+        return api.dumps_json(await api.build_all_parking_data(session))
+
+
+def count_queries(sync_engine):
+    counter = {"queries": 0}
+
+    def count(*args):
+        counter["queries"] += 1
+
+    event.listen(sync_engine, "before_cursor_execute", count)
+    return counter, lambda: event.remove(sync_engine, "before_cursor_execute", count)
+
+
+def report(label, elapsed, queries, body):
+    print(f"{label:<8} {elapsed * 1000:9.1f} ms  {queries:6d} queries  {len(body) / 1e6:6.1f} MB")
+
+
+def measure_legacy():
+    # Calea veche era sync (psycopg2 + lazy load), asa ca o masuram cu un engine sync separat
+    legacy_engine = create_engine(
+        "postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}".format(**api.DB_SETTINGS),
+        connect_args={"sslmode": api.DB_SSLMODE}
+    )
+    counter, stop = count_queries(legacy_engine)
+    try:
+        with Session(legacy_engine) as session:
+            start = time.perf_counter()
+            body = legacy_build(session)
+            elapsed = time.perf_counter() - start
+    finally:
+        stop()
+        legacy_engine.dispose()
+    report("legacy", elapsed, counter["queries"], body)
+
+
+async def measure_current():
+    counter, stop = count_queries(api.engine.sync_engine)
+    try:
+        start = time.perf_counter()
+        body = await current_build()
+        elapsed = time.perf_counter() - start
+    finally:
+        stop()
+    report("current", elapsed, counter["queries"], body)
+
+
+async def run(args):
+    await seed(args.lots, args.coords_per_lot)
+    try:
+        if not args.skip_legacy:
+            await asyncio.to_thread(measure_legacy)
+        await measure_current()
+    finally:
+        if not args.keep:
+            await cleanup()
+        await api.db_pool.close()
+        await api.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GET /api/v1/parcari/all: ORM lazy load vs. un query pe geometria denormalizata")
+    parser.add_argument("--lots", type=int, default=10000)
+    parser.add_argument("--coords-per-lot", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="nu sterge datele generate la final")
+    parser.add_argument("--skip-legacy", action="store_true", help="masoara doar implementarea curenta")
+    args = parser.parse_args()
+
+    api.engine.echo = False
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
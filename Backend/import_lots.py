@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import json
+import sys
+
+import requests
+
+API_BASE_URL = "http://localhost:8000"
+
+
+def import_via_api(payload, api_url):
+    response = requests.post(f"{api_url}/api/v1/parcari/import", json=payload, timeout=300)
+    response.raise_for_status()
+    return response.json()
+
+
+async def import_direct(payload):
+    # Scrie direct in DB. Serverele pornite reincarca indexul spatial si zonele doar la un eveniment "structure";
+    # publish_event nu face nimic aici (CLI-ul nu are bucla de broadcast), deci trimitem NOTIFY direct pe canal
+    import api
+
+    api.engine.echo = False
+    spots, errors = api.parse_import_payload(payload)
+    try:
+        created, insert_errors = await api.import_parking_spots(spots)
+        if created:
+            async with api.db_connection() as conn:
+                await conn.execute(
+                    "SELECT pg_notify($1, $2)",
+                    api.PUBSUB_CHANNEL, json.dumps({"kind": "structure", "origin": None})
+                )
+    finally:
+        if api.db_pool is not None:
+            await api.db_pool.close()
+    errors = sorted(errors + insert_errors, key=lambda error: error["index"])
+    return {"status": "success" if not errors else "partial", "created": created, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import parcari dintr-un fisier GeoJSON sau JSON (lista de parcari)")
+    parser.add_argument("path", help="FeatureCollection GeoJSON sau lista de ParkingSpotCreate")
+    parser.add_argument("--api-url", default=API_BASE_URL)
+    parser.add_argument("--direct", action="store_true", help="scrie direct in baza de date, fara API")
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8") as f:
+        payload = json.load(f)
+
+    result = asyncio.run(import_direct(payload)) if args.direct else import_via_api(payload, args.api_url)
+    if "created" not in result:
+        print(f"Import esuat: {result.get('message')}")
+        sys.exit(1)
+
+    print(f"Parcari create: {len(result['created'])}")
+    for error in result["errors"]:
+        print(f"  #{error['index']}: {error['message']}")
+    sys.exit(1 if result["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+import zlib
+from datetime import datetime, timezone
+
+import httpx
+import websockets
+
+import api
+from bench_concurrency import cleanup, create_lots, percentile, start_server
+
+LOADTEST_PREFIX = "loadtest-"
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50), 3),
+        "p95_ms": round(percentile(values, 0.95), 3),
+        "p99_ms": round(percentile(values, 0.99), 3),
+        "max_ms": round(max(values, default=0), 3),
+    }
+
+
+def db_query_counts():
+    return {labels[0]: series[2] for labels, series in list(api.db_query_duration.series.items())}
+
+
+def db_pool_checkout_count():
+    series = api.db_pool_acquire_duration.series.get(())
+    return series[2] if series is not None else 0
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LoadTestState:
+    def __init__(self, lot_ids, total_spots):
+        self.lot_ids = lot_ids
+        self.total_spots = total_spots
+        self.stop = asyncio.Event()
+        # parking_number -> (valoarea trimisa, momentul trimiterii); un client WebSocket care vede
+        # valoarea respectiva inregistreaza intarzierea de propagare o singura data
+        self.pending = {}
+        self.detection_latencies = []
+        self.detection_failures = 0
+        self.poll_latencies = []
+        self.poll_not_modified = 0
+        self.poll_failures = 0
+        self.ws_messages = 0
+        self.ws_bytes = 0
+        self.propagation_delays = []
+
+
+async def camera_agent(client, state, parking_number, rate):
+    # Fiecare camera are parcarea ei si trimite cu rata fixa; valoarea se schimba la fiecare
+    # trimitere, altfel backend-ul o ignora ca no-op si nu avem ce propaga
+    interval = 1 / rate
+    free_spots = random.randint(0, state.total_spots)
+    next_send = time.perf_counter() + random.random() * interval
+    while not state.stop.is_set():
+        await asyncio.sleep(max(0, next_send - time.perf_counter()))
+        next_send += interval
+        free_spots = (free_spots + 1) % (state.total_spots + 1)
+        payload = {"parking_number": parking_number, "free_spots": free_spots, "total_spots": state.total_spots}
+
+        start = time.perf_counter()
+        state.pending[parking_number] = (free_spots, start)
+        try:
+            response = await client.post("/api/detection", json=payload)
+            ok = response.json().get("status") == "success"
+        except httpx.HTTPError:
+            ok = False
+        state.detection_latencies.append((time.perf_counter() - start) * 1000)
+        if not ok:
+            state.detection_failures += 1
+
+
+def record_propagation(state, seen, parking_number, empty_spots, received_at):
+    pending = state.pending.get(parking_number)
+    if pending is None or pending[0] != empty_spots or seen.get(parking_number) == pending[1]:
+        return
+    seen[parking_number] = pending[1]
+    state.propagation_delays.append((received_at - pending[1]) * 1000)
+
+
+def decode_lots(message, delta, encoding, compressed):
+    # Intoarce perechile (parking_number, empty_spots) dintr-un mesaj, in orice codificare
+    if compressed:
+        message = zlib.decompress(message)
+    if encoding == "binary":
+        count = api.BINARY_HEADER.unpack_from(message)[3]
+        return [
+            api.BINARY_LOT.unpack_from(message, api.BINARY_HEADER.size + i * api.BINARY_LOT.size)[:2]
+            for i in range(count)
+        ]
+
+    payload = api.msgpack.unpackb(message) if encoding == "msgpack" else json.loads(message)
+    if not delta:
+        return [(lot["parking_number"], lot["empty_spots"]) for lot in payload]
+    if payload.get("type") == "delta":
+        return [(change[0], change[1]) for change in payload["changes"]]
+    if payload.get("type") == "snapshot":
+        return [(lot["parking_number"], lot["empty_spots"]) for lot in payload["lots"]]
+    return []
+
+
+async def ws_client(url, state, delta, encoding, compressed):
+    seen = {}
+    async with websockets.connect(url, max_size=None) as ws:
+        while not state.stop.is_set():
+            try:
+                message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            received_at = time.perf_counter()
+            state.ws_messages += 1
+            state.ws_bytes += len(message)
+
+            if isinstance(message, str) and (encoding != "json" or compressed):
+                # Mesajele de control (resumed, error) raman JSON text in orice codificare
+                continue
+            for parking_number, empty_spots in decode_lots(message, delta, encoding, compressed):
+                record_propagation(state, seen, parking_number, empty_spots, received_at)
+
+
+async def poller(client, state, interval, use_etag):
+    etag = None
+    while not state.stop.is_set():
+        headers = {"If-None-Match": etag} if use_etag and etag else {}
+        start = time.perf_counter()
+        try:
+            response = await client.get("/api/v1/parcari/all", headers=headers)
+            state.poll_latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code == 304:
+                state.poll_not_modified += 1
+            elif response.status_code == 200:
+                etag = response.headers.get("etag")
+            else:
+                state.poll_failures += 1
+        except httpx.HTTPError:
+            state.poll_failures += 1
+        await asyncio.sleep(interval)
+
+
+async def run(args):
+    base_url = f"http://127.0.0.1:{args.port}"
+    query = [f"encoding={args.ws_encoding}"]
+    if args.ws_protocol == "delta":
+        query.append("protocol=delta")
+    if args.ws_compress:
+        query.append("compress=deflate")
+    ws_url = f"ws://127.0.0.1:{args.port}/ws/parking?" + "&".join(query)
+
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        lot_ids = await create_lots(client, args.cameras, prefix=LOADTEST_PREFIX, total_spots=args.total_spots)
+
+    state = LoadTestState(lot_ids, args.total_spots)
+    started_at = datetime.now(timezone.utc).isoformat()
+    connections = args.cameras + args.pollers
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        tasks = [
+            asyncio.create_task(ws_client(ws_url, state, args.ws_protocol == "delta", args.ws_encoding, args.ws_compress))
+            for _ in range(args.ws_clients)
+        ]
+        # Lasam clientii WebSocket sa primeasca snapshot-ul initial inainte de incarcare
+        await asyncio.sleep(1)
+
+        queries_before = db_query_counts()
+        checkouts_before = db_pool_checkout_count()
+        tasks += [asyncio.create_task(camera_agent(client, state, pn, args.camera_rate)) for pn in lot_ids]
+        tasks += [
+            asyncio.create_task(poller(client, state, args.poll_interval, not args.no_etag))
+            for _ in range(args.pollers)
+        ]
+        start = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        state.stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        queries_after = db_query_counts()
+        pool_checkouts = db_pool_checkout_count() - checkouts_before
+
+    db_queries = {
+        name: count - queries_before.get(name, 0)
+        for name, count in sorted(queries_after.items())
+        if count - queries_before.get(name, 0)
+    }
+    return {
+        "commit": git_commit(),
+        "started_at": started_at,
+        "config": vars(args),
+        "duration_s": round(elapsed, 3),
+        "detections": {
+            "throughput_per_s": round(len(state.detection_latencies) / elapsed, 1),
+            "failures": state.detection_failures,
+            "latency": summarize(state.detection_latencies),
+        },
+        "polls": {
+            "throughput_per_s": round(len(state.poll_latencies) / elapsed, 1),
+            "not_modified": state.poll_not_modified,
+            "failures": state.poll_failures,
+            "latency": summarize(state.poll_latencies),
+        },
+        "websocket": {
+            "messages": state.ws_messages,
+            "bytes": state.ws_bytes,
+            "messages_per_s": round(state.ws_messages / elapsed, 1),
+        },
+        "propagation": summarize(state.propagation_delays),
+        "db_queries": {
+            "total": sum(db_queries.values()),
+            "per_s": round(sum(db_queries.values()) / elapsed, 1),
+            "by_query": db_queries,
+        },
+        "db_pool_checkouts": {
+            "total": pool_checkouts,
+            "per_s": round(pool_checkouts / elapsed, 1),
+        },
+    }
+
+
+def print_report(result):
+    def line(label, stats):
+        print(f"{label:<22} n={stats['count']:7d}  p50={stats['p50_ms']:8.2f} ms  p95={stats['p95_ms']:8.2f} ms  "
+              f"p99={stats['p99_ms']:8.2f} ms  max={stats['max_ms']:8.2f} ms")
+
+    print(f"Durata: {result['duration_s']} s (commit {result['commit']})")
+    line("POST /api/detection", result["detections"]["latency"])
+    line("GET /api/v1/parcari/all", result["polls"]["latency"])
+    line("detectie -> WebSocket", result["propagation"])
+    print(f"detectii/s={result['detections']['throughput_per_s']}  esuate={result['detections']['failures']}")
+    print(f"poll-uri/s={result['polls']['throughput_per_s']}  304={result['polls']['not_modified']}  "
+          f"esuate={result['polls']['failures']}")
+    print(f"mesaje WebSocket={result['websocket']['messages']}  ({result['websocket']['bytes'] / 1e6:.1f} MB)")
+    print(f"query-uri DB={result['db_queries']['total']}  ({result['db_queries']['per_s']}/s)")
+    for name, count in result["db_queries"]["by_query"].items():
+        print(f"  {name:<28} {count}")
+    print(f"checkout-uri pool DB={result['db_pool_checkouts']['total']}  ({result['db_pool_checkouts']['per_s']}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Test de incarcare: camere care trimit detectii, clienti WebSocket si poll-uri pe /all"
+    )
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--cameras", type=int, default=20, help="numar de camere (cate o parcare fiecare)")
+    parser.add_argument("--camera-rate", type=float, default=1.0, help="detectii pe secunda per camera")
+    parser.add_argument("--total-spots", type=int, default=20)
+    parser.add_argument("--ws-clients", type=int, default=50)
+    parser.add_argument("--ws-protocol", choices=["snapshot", "delta"], default="delta")
+    parser.add_argument("--ws-encoding", choices=list(api.WS_ENCODINGS), default="json")
+    parser.add_argument("--ws-compress", action="store_true", help="cadre comprimate cu deflate")
+    parser.add_argument("--pollers", type=int, default=5, help="clienti care fac poll pe /api/v1/parcari/all")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--no-etag", action="store_true", help="poll-urile nu trimit If-None-Match")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--output", help="salveaza rezultatele ca JSON, pentru comparatii intre commit-uri")
+    args = parser.parse_args()
+
+    api.engine.echo = False
+    server, thread = start_server(args.port)
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        server.should_exit = True
+        thread.join()
+        asyncio.run(cleanup(LOADTEST_PREFIX))
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Rezultate salvate in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+-- Istoric ocupare per parcare (esantioane brute + rollup-uri pe minut/ora/zi)
+
+CREATE TABLE IF NOT EXISTS occupancy_samples (
+    sample_id SERIAL PRIMARY KEY,
+    parking_number INTEGER NOT NULL REFERENCES parking_spots (parking_number),
+    recorded_at TIMESTAMPTZ NOT NULL,
+    empty_spots INTEGER NOT NULL,
+    occupied_spots INTEGER NOT NULL,
+    total_spots INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_occupancy_samples_parking_time
+    ON occupancy_samples (parking_number, recorded_at);
+
+CREATE TABLE IF NOT EXISTS occupancy_rollups (
+    parking_number INTEGER NOT NULL REFERENCES parking_spots (parking_number),
+    bucket_size VARCHAR NOT NULL,
+    bucket_start TIMESTAMPTZ NOT NULL,
+    sample_count INTEGER NOT NULL,
+    min_occupied INTEGER NOT NULL,
+    max_occupied INTEGER NOT NULL,
+    sum_occupied INTEGER NOT NULL,
+    total_spots INTEGER NOT NULL,
+    PRIMARY KEY (parking_number, bucket_size, bucket_start)
+);
@@ -0,0 +1,6 @@
+-- Coordonatele sunt citite mereu per parcare, ordonate dupa point_order
+-- Din migrations/003 citirile folosesc parking_spots.polygon, nu acest index; ramane pentru
+-- stergerile per parcare (DELETE ... WHERE parking_number) si verificarea FK la stergerea unei parcari.
+
+CREATE INDEX IF NOT EXISTS ix_parking_coordinates_parking_order
+    ON parking_coordinates (parking_number, point_order);
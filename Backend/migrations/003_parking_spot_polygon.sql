@@ -0,0 +1,40 @@
+-- Geometria fiecarei parcari, denormalizata pe parking_spots: citirile nu mai fac join pe
+-- parking_coordinates + agregare. polygon = cate 20 de octeti per punct, in ordinea point_order:
+-- float8send(latitude) || float8send(longitude) || int4send(point_order) (big-endian)
+
+ALTER TABLE parking_spots ADD COLUMN IF NOT EXISTS polygon BYTEA;
+ALTER TABLE parking_spots ADD COLUMN IF NOT EXISTS bbox_min_lat DOUBLE PRECISION;
+ALTER TABLE parking_spots ADD COLUMN IF NOT EXISTS bbox_min_lon DOUBLE PRECISION;
+ALTER TABLE parking_spots ADD COLUMN IF NOT EXISTS bbox_max_lat DOUBLE PRECISION;
+ALTER TABLE parking_spots ADD COLUMN IF NOT EXISTS bbox_max_lon DOUBLE PRECISION;
+ALTER TABLE parking_spots ADD COLUMN IF NOT EXISTS centroid_lat DOUBLE PRECISION;
+ALTER TABLE parking_spots ADD COLUMN IF NOT EXISTS centroid_lon DOUBLE PRECISION;
+
+UPDATE parking_spots ps
+SET polygon = g.polygon,
+    bbox_min_lat = g.bbox_min_lat,
+    bbox_min_lon = g.bbox_min_lon,
+    bbox_max_lat = g.bbox_max_lat,
+    bbox_max_lon = g.bbox_max_lon,
+    centroid_lat = g.centroid_lat,
+    centroid_lon = g.centroid_lon
+FROM (
+    SELECT
+        parking_number,
+        string_agg(
+            float8send(latitude::float8) || float8send(longitude::float8) || int4send(point_order),
+            ''::bytea ORDER BY point_order
+        ) AS polygon,
+        min(latitude::float8) AS bbox_min_lat,
+        min(longitude::float8) AS bbox_min_lon,
+        max(latitude::float8) AS bbox_max_lat,
+        max(longitude::float8) AS bbox_max_lon,
+        avg(latitude::float8) AS centroid_lat,
+        avg(longitude::float8) AS centroid_lon
+    FROM parking_coordinates
+    GROUP BY parking_number
+) g
+WHERE ps.parking_number = g.parking_number;
+
+-- Parcari fara coordonate: poligon gol, nu NULL
+UPDATE parking_spots SET polygon = ''::bytea WHERE polygon IS NULL;
@@ -0,0 +1,10 @@
+-- Zone denumite: fie o lista explicita de parcari (parking_numbers), fie un poligon in acelasi
+-- format ca parking_spots.polygon. Contoarele libere/ocupate/total se tin in memorie in backend.
+
+CREATE TABLE IF NOT EXISTS zones (
+    zone_id SERIAL PRIMARY KEY,
+    name VARCHAR NOT NULL UNIQUE,
+    parking_numbers INTEGER[],
+    polygon BYTEA,
+    CHECK ((parking_numbers IS NULL) <> (polygon IS NULL))
+);
@@ -0,0 +1,4 @@
+-- Momentul capturii (la camera) pentru citirea aplicata pe starea live: o citire mai veche, retrimisa
+-- din spool-ul unei camere dupa o pana, nu mai suprascrie una mai noua si ajunge doar in istoric
+
+ALTER TABLE parking_spots ADD COLUMN IF NOT EXISTS detected_at TIMESTAMPTZ;
@@ -0,0 +1,5 @@
+-- Medie ponderata in timp pe rollup-uri: fiecare esantion conteaza cat a durat pana la urmatorul
+-- (plafonat la HISTORY_MAX_GAP). Randurile vechi raman cu 0 si folosesc in continuare media pe esantioane.
+
+ALTER TABLE occupancy_rollups ADD COLUMN IF NOT EXISTS occupied_seconds DOUBLE PRECISION NOT NULL DEFAULT 0;
+ALTER TABLE occupancy_rollups ADD COLUMN IF NOT EXISTS covered_seconds DOUBLE PRECISION NOT NULL DEFAULT 0;
@@ -0,0 +1,84 @@
+import argparse
+import math
+import statistics
+import time
+
+import cv2
+import numpy
+import torch
+from ultralytics import YOLO
+
+from detectie_roi import crop_roi, detect_rois_batched, detect_rois_sequential
+
+def grid_rois(count: int):
+    # Primele `count` celule dintr-o grila aproape patrata peste tot frame-ul
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    return {
+        f"P{i + 1}": ((i % cols) / cols, (i // cols) / rows, (i % cols + 1) / cols, (i // cols + 1) / rows)
+        for i in range(count)
+    }
+
+def load_frame(video_path, width, height):
+    if video_path:
+        cap = cv2.VideoCapture(video_path)
+        ret, frame = cap.read()
+        cap.release()
+        if not ret:
+            raise ValueError(f"Nu s-a putut citi un frame din {video_path}")
+        return frame
+    # Fara video: zgomot, ca timpul sa fie dominat de preprocesare + forward pass
+    return numpy.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=numpy.uint8)
+
+def measure(detect, model, crops, resolution, ticks):
+    latencies = []
+    results = None
+    for _ in range(ticks):
+        start = time.perf_counter()
+        results = detect(model, crops, resolution)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+def counts(results):
+    return {parking_id: (r["free_count"], r["occupied_count"]) for parking_id, r in results.items()}
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"  {label:<11} mean={statistics.mean(latencies):8.1f} ms  "
+          f"p50={statistics.median(latencies):8.1f} ms  p95={p95:8.1f} ms")
+    return statistics.median(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description="Latenta per tick: cate un model.predict per ROI vs. un singur batch")
+    parser.add_argument("--model", default="yolov8n.pt", help="greutatile YOLO (ex. runs/detect/trainX/weights/best.pt)")
+    parser.add_argument("--video", help="ia primul frame din acest video in loc de zgomot")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--resolution", type=int, default=1280, help="latimea la care se redimensioneaza fiecare ROI")
+    parser.add_argument("--rois", type=int, nargs="+", default=[3, 6, 12])
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    args = parser.parse_args()
+
+    model = YOLO(args.model)
+    frame = load_frame(args.video, args.width, args.height)
+    # Castigul batch-ului depinde de cat paralelism are hardware-ul (GPU, nuclee CPU)
+    print(f"device={model.device} torch threads={torch.get_num_threads()} frame={frame.shape[1]}x{frame.shape[0]}")
+
+    for count in args.rois:
+        crops = {parking_id: crop_roi(frame, roi) for parking_id, roi in grid_rois(count).items()}
+        measure(detect_rois_sequential, model, crops, args.resolution, args.warmup)
+        measure(detect_rois_batched, model, crops, args.resolution, args.warmup)
+
+        sequential, sequential_results = measure(detect_rois_sequential, model, crops, args.resolution, args.ticks)
+        batched, batched_results = measure(detect_rois_batched, model, crops, args.resolution, args.ticks)
+
+        print(f"{count} ROI-uri, {args.ticks} tick-uri")
+        sequential_p50 = report("secvential", sequential)
+        batched_p50 = report("batch", batched)
+        same = counts(sequential_results) == counts(batched_results)
+        print(f"  speedup p50 = {sequential_p50 / batched_p50:.2f}x  rezultate identice: {'da' if same else 'NU'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+from typing import Optional
+
+from detectie_motion import MotionGate
+
+def add_common_arguments(parser: argparse.ArgumentParser, defaults: dict):
+    parser.add_argument("--config", help="fisier JSON cu aceleasi chei ca argumentele (ex. {\"camera_index\": 0}); "
+                                         "argumentele din linia de comanda au prioritate")
+    parser.add_argument("--api-base-url", default=defaults["api_base_url"])
+    parser.add_argument("--runs-folder", default=defaults["runs_folder"],
+                        help="folderul cu antrenari; se foloseste ultimul train*/weights/best.pt")
+    parser.add_argument("--model", help="calea directa catre greutati, in loc de --runs-folder")
+    parser.add_argument("--camera-index", type=int, default=defaults["camera_index"])
+    parser.add_argument("--fallback-video", default=defaults["fallback_video"],
+                        help="video folosit daca nu se poate deschide camera")
+    parser.add_argument("--update-interval", type=float, default=1, help="secunde intre doua inferente")
+    parser.add_argument("--stats-interval", type=float, default=5, help="secunde intre rapoartele pipeline-ului")
+    parser.add_argument("--headless", action="store_true",
+                        help="fara ferestre si fara desen: tot CPU-ul merge la captura si inferenta")
+    parser.add_argument("--sequential", action="store_true",
+                        help="bucla veche, fara thread-uri (doar cu afisare)")
+    parser.add_argument("--spool-dir",
+                        default=os.path.join(os.path.expanduser("~"), ".parking_spool", os.path.splitext(parser.prog)[0]),
+                        help="unde se pastreaza rezultatele netrimise cat timp API-ul e indisponibil")
+    parser.add_argument("--spool-max-batches", type=int, default=10000,
+                        help="peste aceasta limita se renunta la cele mai vechi rezultate din spool")
+    parser.add_argument("--upload-timeout", type=float, default=5)
+    parser.add_argument("--no-motion-gate", action="store_true", help="ruleaza YOLO la fiecare tick, fara detectie de schimbare")
+    parser.add_argument("--motion-threshold", type=float, default=0.01,
+                        help="fractiunea de pixeli schimbati dintr-un ROI peste care se ruleaza inferenta")
+    parser.add_argument("--motion-pixel-threshold", type=int, default=25,
+                        help="diferenta de intensitate (0-255) de la care un pixel conteaza ca schimbat")
+    parser.add_argument("--force-refresh", type=float, default=60,
+                        help="secunde dupa care un ROI se reanalizeaza oricum, chiar fara schimbari")
+
+def parse_args(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    # Cheile din --config devin valori implicite, deci linia de comanda le poate suprascrie
+    args, _ = parser.parse_known_args()
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            config = json.load(f)
+        known = {action.dest for action in parser._actions}
+        unknown = sorted(set(config) - known)
+        if unknown:
+            parser.error(f"chei necunoscute in {args.config}: {', '.join(unknown)}")
+        parser.set_defaults(**config)
+    args = parser.parse_args()
+    if args.headless and args.sequential:
+        parser.error("--headless foloseste intotdeauna pipeline-ul, nu se poate combina cu --sequential")
+    return args
+
+def create_motion_gate(args: argparse.Namespace) -> Optional[MotionGate]:
+    if args.no_motion_gate:
+        return None
+    return MotionGate(args.motion_threshold, args.motion_pixel_threshold, args.force_refresh)
+
+def resolve_model_path(args: argparse.Namespace) -> str:
+    if args.model:
+        if not os.path.isfile(args.model):
+            raise FileNotFoundError(f"Modelul {args.model} nu există!")
+        return args.model
+
+    train_folders = [f for f in os.listdir(args.runs_folder) if f.startswith("train")]
+    train_folders.sort()
+    if not train_folders:
+        raise ValueError(f"Niciun folder 'train' găsit în {args.runs_folder}")
+
+    last_train = train_folders[-1]
+    model_path = os.path.join(args.runs_folder, last_train, "weights", "best.pt")
+    if not os.path.isfile(model_path):
+        raise FileNotFoundError(f"Modelul {model_path} nu există!")
+    return model_path
@@ -0,0 +1,87 @@
+import threading
+import time
+from typing import Any, Dict, List
+
+import cv2
+import numpy
+
+class MotionGate:
+    # Detector de schimbare ieftin per ROI: crop-ul micsorat (gri + blur) se compara cu cel de la ultima inferenta.
+    # YOLO ruleaza doar daca s-au schimbat destui pixeli sau a trecut force_refresh de la ultima inferenta.
+    # Comparam cu ultima inferenta, nu cu frame-ul anterior, ca miscarile lente sa se adune pana trec pragul.
+    # Referinta noua devine activa abia in record_inference: daca inferenta esueaza, ROI-ul se reincearca la tick-ul urmator.
+    def __init__(self, threshold: float = 0.01, pixel_threshold: int = 25, force_refresh: float = 60, width: int = 64):
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.force_refresh = force_refresh
+        self.width = width
+        self.references: Dict[str, Any] = {}
+        self.pending: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+        self.checks = self.skipped = 0
+        self.check_time = 0.0
+        self.total_checks = self.total_skipped = 0
+        self.total_saved = self.total_check_time = 0.0
+        # Secunde de inferenta per ROI (medie exponentiala), ca sa estimam cat CPU economisim la fiecare skip
+        self.inference_cost = None
+
+    def downscale(self, crop: Any) -> Any:
+        h, w = crop.shape[:2]
+        small = cv2.resize(crop, (self.width, max(1, round(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+    def should_infer(self, key: str, crop: Any) -> bool:
+        start = time.perf_counter()
+        small = self.downscale(crop)
+        now = time.monotonic()
+        reference = self.references.get(key)
+        if reference is None or now - reference[1] >= self.force_refresh or reference[0].shape != small.shape:
+            changed = True
+        else:
+            diff = cv2.absdiff(small, reference[0])
+            changed = numpy.count_nonzero(diff > self.pixel_threshold) / diff.size > self.threshold
+        if changed:
+            self.pending[key] = (small, now)
+
+        check_time = time.perf_counter() - start
+        with self.lock:
+            self.checks += 1
+            self.total_checks += 1
+            self.check_time += check_time
+            self.total_check_time += check_time
+            if not changed:
+                self.skipped += 1
+                self.total_skipped += 1
+                self.total_saved += self.inference_cost or 0
+        return changed
+
+    def record_inference(self, keys: List[str], elapsed: float):
+        for key in keys:
+            if key in self.pending:
+                self.references[key] = self.pending.pop(key)
+        if not keys:
+            return
+        cost = elapsed / len(keys)
+        with self.lock:
+            self.inference_cost = cost if self.inference_cost is None else 0.8 * self.inference_cost + 0.2 * cost
+
+    def report(self, elapsed: float) -> str:
+        with self.lock:
+            checks, self.checks = self.checks, 0
+            skipped, self.skipped = self.skipped, 0
+            check_time, self.check_time = self.check_time, 0.0
+            cost = self.inference_cost or 0
+
+        percent = skipped / checks * 100 if checks else 0.0
+        # Economia neta: inferentele sarite minus cat au costat verificarile
+        saved = skipped * cost - check_time
+        return (f"motion {checks / elapsed:5.1f} verificari/s sarite={skipped}/{checks} ({percent:.0f}%) "
+                f"CPU economisit ~{saved:.1f}s (inferenta/ROI {cost * 1000:.0f}ms, "
+                f"verificare {check_time / checks * 1000 if checks else 0:.1f}ms)")
+
+    def summary(self) -> str:
+        with self.lock:
+            percent = self.total_skipped / self.total_checks * 100 if self.total_checks else 0.0
+            return (f"Inferente sarite: {self.total_skipped}/{self.total_checks} ({percent:.0f}%), "
+                    f"CPU economisit estimat ~{self.total_saved - self.total_check_time:.1f}s")
@@ -0,0 +1,237 @@
+import signal
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, List, Optional, Tuple
+
+import cv2
+
+STATS_WINDOW = 200
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=STATS_WINDOW)
+        self.ages = deque(maxlen=STATS_WINDOW)
+        self.count = 0
+        self.drops = 0
+        self.depth = 0
+
+    def record(self, latency: float, age: Optional[float] = None):
+        with self.lock:
+            self.count += 1
+            self.latencies.append(latency)
+            if age is not None:
+                self.ages.append(age)
+
+    def drop(self, count: int = 1):
+        with self.lock:
+            self.drops += count
+
+    def report(self, elapsed: float) -> str:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            ages = sorted(self.ages)
+            count, self.count = self.count, 0
+            drops, self.drops = self.drops, 0
+
+        def p(values, q):
+            return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+        text = (f"{self.name} {count / elapsed:5.1f}/s depth={self.depth} drop={drops} "
+                f"lat p50={p(latencies, 0.5):.0f}ms p95={p(latencies, 0.95):.0f}ms")
+        if ages:
+            text += f" varsta frame p50={p(ages, 0.5):.0f}ms"
+        return text
+
+class LatestFrameBuffer:
+    # Buffer marginit: la plin se arunca cel mai vechi frame, consumatorii iau mereu cel mai nou
+    def __init__(self, stats: StageStats, size: int = 1):
+        self.stats = stats
+        self.frames = deque(maxlen=size)
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.closed = False
+
+    def put(self, frame: Any):
+        with self.condition:
+            if len(self.frames) == self.frames.maxlen:
+                self.stats.drop()
+            self.seq += 1
+            self.frames.append((self.seq, frame, time.perf_counter()))
+            self.stats.depth = len(self.frames)
+            self.condition.notify_all()
+
+    def latest_after(self, seq: int, timeout: float) -> Optional[Tuple[int, Any, float]]:
+        with self.condition:
+            self.condition.wait_for(lambda: self.closed or self.seq > seq, timeout=timeout)
+            if self.seq <= seq or not self.frames:
+                return None
+            latest = self.frames[-1]
+            self.frames.clear()
+            self.stats.depth = 0
+            return latest
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class Pipeline:
+    # Captura si inferenta ruleaza in thread-uri separate; randarea ramane pe thread-ul principal
+    # (cv2.imshow) si deseneaza ultimele detectii peste fiecare frame nou, la frame rate-ul camerei.
+    # Cu render=None (headless) nu exista randare deloc: thread-ul principal doar asteapta oprirea.
+    # upload trebuie sa nu blocheze (ResultUploader.submit); extra_stats (orice obiect cu report(elapsed))
+    # apar in raportul periodic. detect poate intoarce None cand nu are rezultate noi.
+    def __init__(self, cap, detect: Callable[[Any], Any], render: Optional[Callable[[Any, Any], None]],
+                 upload: Callable[[Any], None], detect_interval: float,
+                 buffer_size: int = 1, stats_interval: float = 5, extra_stats: Optional[List[StageStats]] = None):
+        self.cap = cap
+        self.detect = detect
+        self.render = render
+        self.upload = upload
+        self.detect_interval = detect_interval
+        self.stats_interval = stats_interval
+        self.stop_event = threading.Event()
+
+        self.capture_stats = StageStats("captura")
+        self.inference_stats = StageStats("inferenta")
+        self.render_stats = StageStats("randare")
+        self.extra_stats = extra_stats or []
+
+        # Doua buffere separate: inferenta si randarea iau fiecare cel mai nou frame, independent
+        self.inference_frames = LatestFrameBuffer(self.inference_stats, buffer_size)
+        self.render_frames = LatestFrameBuffer(self.render_stats, buffer_size)
+
+        self.results_lock = threading.Lock()
+        self.results = None
+
+        # Un fisier video se citeste mult mai repede decat in timp real, asa ca il limitam la fps-ul lui
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        self.frame_interval = 1 / fps if cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0 else 0
+
+    def latest_results(self):
+        with self.results_lock:
+            return self.results
+
+    def capture_loop(self):
+        next_frame = time.perf_counter()
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret or frame is None:
+                print("Eroare la citirea frame-ului, retry...")
+                time.sleep(0.5)
+                ret, frame = self.cap.read()
+                if not ret or frame is None:
+                    print("Nu am putut citi frame dupa retry.")
+                    break
+            self.capture_stats.record(time.perf_counter() - start)
+            self.inference_frames.put(frame)
+            if self.render is not None:
+                self.render_frames.put(frame)
+
+            if self.frame_interval:
+                next_frame += self.frame_interval
+                time.sleep(max(0, next_frame - time.perf_counter()))
+        self.stop()
+
+    def inference_loop(self):
+        seq = 0
+        last_detection = 0
+        while not self.stop_event.is_set():
+            wait = last_detection + self.detect_interval - time.perf_counter()
+            if wait > 0:
+                self.stop_event.wait(wait)
+                continue
+
+            latest = self.inference_frames.latest_after(seq, timeout=0.5)
+            if latest is None:
+                continue
+            seq, frame, captured_at = latest
+            last_detection = time.perf_counter()
+            try:
+                results = self.detect(frame)
+            except Exception as e:
+                print(f"Eroare la inferenta: {e}")
+                continue
+            if results is None:
+                # Nimic nou de raportat (ex. niciun ROI nu s-a schimbat): pastram rezultatele anterioare
+                continue
+            done = time.perf_counter()
+            self.inference_stats.record(done - last_detection, done - captured_at)
+
+            with self.results_lock:
+                self.results = results
+            self.upload(results)
+
+    def stop(self):
+        self.stop_event.set()
+        self.inference_frames.close()
+        self.render_frames.close()
+
+    def print_stats(self, elapsed: float):
+        stages = [self.capture_stats, self.inference_stats]
+        if self.render is not None:
+            stages.append(self.render_stats)
+        stages.extend(self.extra_stats)
+        for stats in stages:
+            print(f"[pipeline] {stats.report(elapsed)}")
+
+    def handle_signal(self, signum, frame):
+        print(f"Semnal {signal.Signals(signum).name}, oprire...")
+        self.stop()
+
+    def render_loop(self):
+        seq = 0
+        last_stats = time.perf_counter()
+        while not self.stop_event.is_set():
+            latest = self.render_frames.latest_after(seq, timeout=0.1)
+            if latest is not None:
+                seq, frame, captured_at = latest
+                start = time.perf_counter()
+                self.render(frame, self.latest_results())
+                done = time.perf_counter()
+                self.render_stats.record(done - start, done - captured_at)
+
+            key = cv2.waitKey(1) & 0xFF
+            if key in [ord('q'), 27]:
+                print("Oprire manuala...")
+                break
+
+            now = time.perf_counter()
+            if now - last_stats >= self.stats_interval:
+                self.print_stats(now - last_stats)
+                last_stats = now
+
+    def headless_loop(self):
+        last_stats = time.perf_counter()
+        while not self.stop_event.wait(self.stats_interval):
+            now = time.perf_counter()
+            self.print_stats(now - last_stats)
+            last_stats = now
+
+    def run(self):
+        # SIGINT (Ctrl+C) si SIGTERM (systemd, docker stop) opresc thread-urile curat
+        previous_handlers = {
+            signum: signal.signal(signum, self.handle_signal) for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        threads = [
+            threading.Thread(target=self.capture_loop, name="captura", daemon=True),
+            threading.Thread(target=self.inference_loop, name="inferenta", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            if self.render is None:
+                self.headless_loop()
+            else:
+                self.render_loop()
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join(timeout=5)
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
@@ -0,0 +1,101 @@
+import cv2
+import torch
+from torchvision.ops import batched_nms, nms
+from typing import Any, Dict, List, Tuple
+
+DETECTION_RESOLUTION = 1280
+CONFIDENCE = 0.3
+NMS_IOU = 0.4
+
+def simplify_class_name(name: str) -> str:
+    name = name.lower()
+    if "empty" in name:
+        return "empty"
+    elif "occupied" in name:
+        return "occupied"
+    return name
+
+def crop_roi(frame: Any, roi: Tuple[float, float, float, float]) -> Any:
+    # roi = (x1, y1, x2, y2) ca fractiuni din frame, ca acelasi config sa mearga la orice rezolutie
+    h, w = frame.shape[:2]
+    x1, y1, x2, y2 = roi
+    return frame[int(h * y1):int(h * y2), int(w * x1):int(w * x2)]
+
+def prepare_crop(frame_crop: Any, resolution: int = DETECTION_RESOLUTION) -> Tuple[Any, float, float]:
+    h_orig, w_orig = frame_crop.shape[:2]
+    detection_w = resolution
+    # Inaltimea rotunjita la stride-ul YOLO (32): ROI-uri aproape egale ajung la exact aceeasi forma
+    detection_h = max(32, round(h_orig * resolution / w_orig / 32) * 32)
+    resized = cv2.resize(frame_crop, (detection_w, detection_h), interpolation=cv2.INTER_AREA)
+    return resized, w_orig / detection_w, h_orig / detection_h
+
+def build_results(model, boxes, scores, classes, scale_x: float, scale_y: float) -> Dict[str, Any]:
+    free_count = occupied_count = 0
+    detections = []
+
+    # Box-urile revin in coordonatele crop-ului original (inainte de resize)
+    boxes = boxes * torch.tensor([scale_x, scale_y, scale_x, scale_y])
+    for box, score, cls in zip(boxes.int().tolist(), scores.tolist(), classes.tolist()):
+        simple = simplify_class_name(model.names[int(cls)])
+        detections.append({
+            "box": tuple(box),
+            "score": score,
+            "label": f"{simple} {score:.2f}",
+            "simple_name": simple
+        })
+
+        if simple == "empty":
+            free_count += 1
+        elif simple == "occupied":
+            occupied_count += 1
+
+    return {"free_count": free_count, "occupied_count": occupied_count, "detections": detections}
+
+def detect_rois_sequential(model, crops: Dict[str, Any], resolution: int = DETECTION_RESOLUTION) -> Dict[str, Dict[str, Any]]:
+    # Varianta initiala: cate un model.predict si cate un NMS pentru fiecare parcare
+    results = {}
+    for parking_id, frame_crop in crops.items():
+        frame_for_detection, scale_x, scale_y = prepare_crop(frame_crop, resolution)
+        r = model.predict(source=frame_for_detection, conf=CONFIDENCE, verbose=False)[0]
+        boxes = r.boxes.xyxy.cpu()
+        scores = r.boxes.conf.cpu()
+        classes = r.boxes.cls.cpu()
+
+        keep = nms(boxes, scores, iou_threshold=NMS_IOU)
+        results[parking_id] = build_results(model, boxes[keep], scores[keep], classes[keep], scale_x, scale_y)
+    return results
+
+def detect_rois_batched(model, crops: Dict[str, Any], resolution: int = DETECTION_RESOLUTION) -> Dict[str, Dict[str, Any]]:
+    # Toate ROI-urile unui frame intr-un singur model.predict (un forward pass pe batch) si un singur NMS;
+    # indexul ROI-ului e grupul din batched_nms, deci box-uri din parcari diferite nu se suprima intre ele
+    parking_ids = list(crops)
+    if not parking_ids:
+        return {}
+    prepared = [prepare_crop(crops[parking_id], resolution) for parking_id in parking_ids]
+
+    # Un batch per forma: cu forme amestecate ultralytics face letterbox patrat pe tot batch-ul,
+    # adica mai multi pixeli de procesat decat secvential
+    shapes: Dict[Tuple[int, int], List[int]] = {}
+    for i, (frame_for_detection, _, _) in enumerate(prepared):
+        shapes.setdefault(frame_for_detection.shape[:2], []).append(i)
+    predictions = [None] * len(prepared)
+    for indices in shapes.values():
+        batch = model.predict(source=[prepared[i][0] for i in indices], conf=CONFIDENCE, verbose=False)
+        for i, r in zip(indices, batch):
+            predictions[i] = r
+
+    boxes = torch.cat([r.boxes.xyxy.cpu() for r in predictions])
+    scores = torch.cat([r.boxes.conf.cpu() for r in predictions])
+    classes = torch.cat([r.boxes.cls.cpu() for r in predictions])
+    roi_index = torch.cat([torch.full((len(r.boxes),), i, dtype=torch.int64) for i, r in enumerate(predictions)])
+
+    keep = batched_nms(boxes, scores, roi_index, iou_threshold=NMS_IOU)
+    keep = keep[torch.argsort(roi_index[keep], stable=True)]
+    boxes, scores, classes, roi_index = boxes[keep], scores[keep], classes[keep], roi_index[keep]
+
+    results = {}
+    for i, parking_id in enumerate(parking_ids):
+        mask = roi_index == i
+        _, scale_x, scale_y = prepared[i]
+        results[parking_id] = build_results(model, boxes[mask], scores[mask], classes[mask], scale_x, scale_y)
+    return results
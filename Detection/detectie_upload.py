@@ -0,0 +1,204 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from detectie_pipeline import StageStats
+
+class Spool:
+    # Cate un fisier JSON per batch, numerotat crescator: ordinea se pastreaza si dupa un restart,
+    # iar scrierea prin fisier temporar + os.replace nu lasa batch-uri pe jumatate la o cadere de curent
+    def __init__(self, directory: str, max_batches: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_batches = max_batches
+        self.files = deque(sorted(f for f in os.listdir(directory) if f.endswith(".json")))
+        self.next_seq = int(self.files[-1][:-len(".json")]) + 1 if self.files else 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def append(self, batch: List[Dict[str, Any]]):
+        name = f"{self.next_seq:012d}.json"
+        self.next_seq += 1
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(batch, f)
+        os.replace(path + ".tmp", path)
+        self.files.append(name)
+
+        while len(self.files) > self.max_batches:
+            # Spool plin: renuntam la cele mai vechi rezultate, cele noi conteaza mai mult
+            self.remove(self.files.popleft())
+            self.dropped += 1
+
+    def oldest(self, count: int = 1) -> List[List[Dict[str, Any]]]:
+        batches = []
+        i = 0
+        while i < len(self.files) and len(batches) < count:
+            try:
+                with open(os.path.join(self.directory, self.files[i]), encoding="utf-8") as f:
+                    batches.append(json.load(f))
+                i += 1
+            except (OSError, ValueError) as e:
+                print(f"Batch corupt in spool ({self.files[i]}), il sar: {e}")
+                self.remove(self.files[i])
+                del self.files[i]
+        return batches
+
+    def pop(self, count: int = 1):
+        for _ in range(min(count, len(self.files))):
+            self.remove(self.files.popleft())
+
+    def remove(self, name: str):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+class ResultUploader:
+    # submit() doar pune rezultatele intr-o coada in memorie, deci inferenta nu asteapta niciodata dupa retea.
+    # Fiecare rezultat primeste detected_at (momentul detectiei), pastrat si in spool. Thread-ul de upload
+    # trimite pe o sesiune keep-alive si comaseaza tick-urile adunate intr-un singur POST; la eroare trece
+    # batch-urile in spool si reincearca cu backoff exponential. Dupa revenire rezultatele noi pleaca primele,
+    # iar spool-ul se retrimite in ordine, cate replay_batches intr-un POST: API-ul aplica pe starea live doar
+    # citirea cea mai noua per parcare, iar pe cele mai vechi le pune in istoric la momentul lor.
+    def __init__(self, api_base_url: str, spool_dir: str, max_spool_batches: int = 10000, timeout: float = 5,
+                 max_backoff: float = 60, queue_size: int = 100, replay_batches: int = 50):
+        self.url = f"{api_base_url}/api/detection/batch"
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.replay_batches = replay_batches
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+        self.stats = StageStats("upload")
+        self.pending = deque()
+        self.queue_size = queue_size
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.spool = Spool(spool_dir, max_spool_batches)
+        self.failures = 0
+        self.retry_at = 0.0
+        self.thread = threading.Thread(target=self.run, name="upload", daemon=True)
+
+        if len(self.spool):
+            print(f"{len(self.spool)} batch-uri nesincronizate in {spool_dir}, le retrimit in ordine")
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, payloads: List[Dict[str, Any]]):
+        if not payloads:
+            return
+        detected_at = time.time()
+        payloads = [dict(payload, detected_at=payload.get("detected_at", detected_at)) for payload in payloads]
+        with self.condition:
+            if len(self.pending) >= self.queue_size:
+                self.pending.popleft()
+                self.stats.drop()
+            self.pending.append(payloads)
+            self.stats.depth = len(self.pending) + len(self.spool)
+            self.condition.notify()
+
+    def close(self, timeout: float = 10):
+        # Ce n-a apucat sa plece ramane in spool si se trimite la urmatoarea pornire
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.thread.join(timeout=timeout)
+        self.session.close()
+
+    def post(self, batch: List[Dict[str, Any]], verbose: bool = True) -> bool:
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url, json=batch, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"Eroare conexiune API: {e}")
+            return False
+        finally:
+            self.stats.record(time.perf_counter() - start)
+
+        if response.status_code >= 500 or response.status_code == 429:
+            print(f"Eroare API ({response.status_code}), reincerc: {response.text}")
+            return False
+        if response.status_code != 200:
+            # 4xx: payload-ul e respins, reincercarea nu ajuta
+            print(f"Eroare API ({response.status_code}): {response.text}")
+            return True
+        try:
+            body = response.json()
+        except ValueError:
+            print(f"Raspuns API invalid, reincerc: {response.text}")
+            return False
+        if body.get("status") != "success":
+            # API-ul raspunde 200 si cand DB-ul e cazut; batch-ul ramane in spool pana trece
+            print(f"Eroare API, reincerc: {body.get('message')}")
+            return False
+        for result in body.get("results", []):
+            if not verbose and result["status"] == "success":
+                continue
+            if result["status"] == "success":
+                print(f"Date trimise pentru Parking ID {result['parking_number']}: {result['data']}")
+            else:
+                print(f"Eroare API pentru {result['parking_number']}: {result['message']}")
+        return True
+
+    def backoff(self):
+        delay = min(self.max_backoff, 2 ** self.failures) * random.uniform(0.5, 1)
+        self.failures += 1
+        self.retry_at = time.monotonic() + delay
+        print(f"Upload esuat ({self.failures}), reincerc in {delay:.1f}s; {len(self.spool)} batch-uri in spool")
+
+    def ready_to_send(self) -> bool:
+        return len(self.spool) > 0 and time.monotonic() >= self.retry_at
+
+    def run(self):
+        while True:
+            with self.condition:
+                timeout = max(0.0, self.retry_at - time.monotonic()) if len(self.spool) else None
+                self.condition.wait_for(lambda: self.stopping or self.pending or self.ready_to_send(), timeout=timeout)
+                batches = list(self.pending)
+                self.pending.clear()
+                stopping = self.stopping
+
+            # In backoff rezultatele noi merg in spool; altfel pleaca inaintea celor vechi din spool,
+            # ca starea live sa fie la zi imediat (detected_at pastreaza ordinea pentru istoric)
+            if stopping or time.monotonic() < self.retry_at:
+                for batch in batches:
+                    self.spool.append(batch)
+                batches = []
+            self.stats.depth = len(self.pending) + len(self.spool)
+            if stopping:
+                break
+
+            if batches:
+                # Tick-urile adunate cat a durat request-ul anterior pleaca impreuna; ultima valoare per parcare castiga
+                merged = {payload["parking_number"]: payload for batch in batches for payload in batch}
+                if self.post(list(merged.values())):
+                    self.failures = 0
+                else:
+                    for batch in batches:
+                        self.spool.append(batch)
+                    self.backoff()
+            elif self.ready_to_send():
+                batches = self.spool.oldest(self.replay_batches)
+                if not batches:
+                    continue
+                if self.post([payload for batch in batches for payload in batch], verbose=False):
+                    self.spool.pop(len(batches))
+                    self.failures = 0
+                    if not len(self.spool):
+                        print("Spool golit, upload-ul e din nou la zi")
+                else:
+                    self.backoff()
+            self.stats.drop(self.spool.dropped)
+            self.spool.dropped = 0
@@ -1,10 +1,12 @@
-import os
+import argparse
 import torch
 import cv2
 import time
-import requests
 from ultralytics import YOLO
 from torchvision.ops import nms
+from detectie_pipeline import Pipeline
+from detectie_config import add_common_arguments, create_motion_gate, parse_args, resolve_model_path
+from detectie_upload import ResultUploader
 
 API_BASE_URL = "http://56.228.19.103:8000"
 PARKING_NUMBER = "100000053"
@@ -14,16 +16,23 @@ fallback_video_path = "C:/Unihack2025/ObDetector/venv/test_videos/videoccc.mp4"
 
 CAMERA_INDEX = 1
 
-train_folders = [f for f in os.listdir(runs_folder) if f.startswith("train")]
-train_folders.sort()
-if not train_folders:
-    raise ValueError(f"Niciun folder 'train' găsit în {runs_folder}")
-
-last_train = train_folders[-1]
-model_path = os.path.join(runs_folder, last_train, "weights", "best.pt")
-if not os.path.isfile(model_path):
-    raise FileNotFoundError(f"Modelul {model_path} nu există!")
-
+# Valorile de mai sus sunt doar implicite; pe edge box-uri se dau prin --config sau argumente
+parser = argparse.ArgumentParser(description="Detectie live pentru o parcare")
+add_common_arguments(parser, {
+    "api_base_url": API_BASE_URL,
+    "runs_folder": runs_folder,
+    "camera_index": CAMERA_INDEX,
+    "fallback_video": fallback_video_path,
+})
+parser.add_argument("--parking-number", default=PARKING_NUMBER)
+args = parse_args(parser)
+
+API_BASE_URL = args.api_base_url
+PARKING_NUMBER = args.parking_number
+CAMERA_INDEX = args.camera_index
+fallback_video_path = args.fallback_video
+
+model_path = resolve_model_path(args)
 print(f"Folosește modelul: {model_path}")
 
 model = YOLO(model_path)
@@ -40,20 +49,14 @@ def simplify_class_name(name: str) -> str:
         return name
 
 def send_to_api(free_count, occupied_count):
+    # Nu blocheaza: uploader-ul trimite din thread-ul lui (keep-alive, backoff, spool pe disc)
     total_spots = free_count + occupied_count
     payload = {
         "parking_number": int(PARKING_NUMBER),
         "free_spots": free_count,
         "total_spots": total_spots
     }
-    try:
-        response = requests.post(f"{API_BASE_URL}/api/detection", json=payload, timeout=5)
-        if response.status_code == 200:
-            print(f"Date trimise către API: {payload}")
-        else:
-            print(f"Eroare API ({response.status_code}): {response.text}")
-    except Exception as e:
-        print(f"Eroare conexiune cu API: {e}")
+    uploader.submit([payload])
 
 def open_camera_source():
     print(f"Încerc să deschid camera la index {CAMERA_INDEX}...")
@@ -67,87 +70,69 @@ def open_camera_source():
         cap = cv2.VideoCapture(fallback_video_path)
         return cap
 
-cap = open_camera_source()
-if not cap.isOpened():
-    raise ValueError("Nu s-a putut deschide nicio sursă video.")
-
-fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
-
-update_interval = 1
-
-frame_count = 0
-last_update_time = 0
-free_count = occupied_count = total_count = 0
-last_detections = []
-
-cv2.namedWindow("YOLO Parking Detection", cv2.WINDOW_NORMAL)
-cv2.resizeWindow("YOLO Parking Detection", 1280, 720)
-
-print("Pornim analiza în timp real...")
-
-while True:
-    ret, frame = cap.read()
-    if not ret or frame is None:
-        print("Eroare la citirea frame-ului, retry...")
-        time.sleep(0.5)
-        ret, frame = cap.read()
-        if not ret or frame is None:
-            print("Nu am putut citi frame după retry.")
-            break
-
-    frame_count += 1
-    current_time = time.time()
-
-    if current_time - last_update_time >= update_interval or not last_detections:
-        last_update_time = current_time
-        print("Actualizare YOLO...")
-        results = model.predict(source=frame, conf=0.3, verbose=False)
-
-        free_count = occupied_count = total_count = 0
-        last_detections = []
-
-        for r in results:
-            boxes = r.boxes.xyxy.cpu()
-            scores = r.boxes.conf.cpu()
-            classes = r.boxes.cls.cpu()
-
-            keep = nms(boxes, scores, iou_threshold=0.4)
-            boxes = boxes[keep]
-            scores = scores[keep]
-            classes = classes[keep]
-
-            for box, score, cls in zip(boxes, scores, classes):
-                class_name = model.names[int(cls)]
-                simple_name = simplify_class_name(class_name)
-                x1, y1, x2, y2 = map(int, box)
-
-                label = f"{simple_name} {float(score):.2f}"
-                last_detections.append({
-                    "box": (x1, y1, x2, y2),
-                    "score": float(score),
-                    "label": label,
-                    "simple_name": simple_name
-                })
-
-                if simple_name in ["empty", "occupied"]:
-                    total_count += 1
-                    if simple_name == "empty":
-                        free_count += 1
-                    elif simple_name == "occupied":
-                        occupied_count += 1
-
-        print(f"Free={free_count}, Occupied={occupied_count}, Total={total_count}")
-        send_to_api(free_count, occupied_count)
-
-        del results
-        torch.cuda.empty_cache()
+def detect_frame(frame):
+    # Tot frame-ul e un singur ROI: fara miscare nu rulam YOLO si pastram ultimele rezultate
+    if motion_gate is not None and not motion_gate.should_infer("frame", frame):
+        return None
+    print("Actualizare YOLO...")
+    start = time.perf_counter()
+    results = model.predict(source=frame, conf=0.3, verbose=False)
+    if motion_gate is not None:
+        motion_gate.record_inference(["frame"], time.perf_counter() - start)
+
+    free_count = occupied_count = total_count = 0
+    detections = []
+
+    for r in results:
+        boxes = r.boxes.xyxy.cpu()
+        scores = r.boxes.conf.cpu()
+        classes = r.boxes.cls.cpu()
+
+        keep = nms(boxes, scores, iou_threshold=0.4)
+        boxes = boxes[keep]
+        scores = scores[keep]
+        classes = classes[keep]
+
+        for box, score, cls in zip(boxes, scores, classes):
+            class_name = model.names[int(cls)]
+            simple_name = simplify_class_name(class_name)
+            x1, y1, x2, y2 = map(int, box)
+
+            label = f"{simple_name} {float(score):.2f}"
+            detections.append({
+                "box": (x1, y1, x2, y2),
+                "score": float(score),
+                "label": label,
+                "simple_name": simple_name
+            })
+
+            if simple_name in ["empty", "occupied"]:
+                total_count += 1
+                if simple_name == "empty":
+                    free_count += 1
+                elif simple_name == "occupied":
+                    occupied_count += 1
+
+    print(f"Free={free_count}, Occupied={occupied_count}, Total={total_count}")
+
+    del results
+    torch.cuda.empty_cache()
+    return {"free_count": free_count, "occupied_count": occupied_count, "detections": detections}
+
+def upload_results(results):
+    send_to_api(results["free_count"], results["occupied_count"])
+
+def render_frame(frame, results):
+    results = results or {"free_count": 0, "occupied_count": 0, "detections": []}
+    free_count = results["free_count"]
+    occupied_count = results["occupied_count"]
 
     display_frame = frame.copy()
     cv2.rectangle(display_frame, (10, 10), (420, 80), (255, 255, 255), -1)
     text = f"Free: {free_count} | Occupied: {occupied_count} | Total: {free_count + occupied_count}"
     cv2.putText(display_frame, text, (20, 55), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
 
-    for det in last_detections:
+    for det in results["detections"]:
         x1, y1, x2, y2 = det["box"]
         label = det["label"]
         simple_name = det["simple_name"]
@@ -158,11 +143,64 @@ while True:
 
     cv2.imshow("YOLO Parking Detection", display_frame)
 
-    key = cv2.waitKey(int(1000 / fps)) & 0xFF
-    if key in [ord('q'), 27]:
-        print("Oprire manuală...")
-        break
+cap = open_camera_source()
+if not cap.isOpened():
+    raise ValueError("Nu s-a putut deschide nicio sursă video.")
+
+uploader = ResultUploader(API_BASE_URL, args.spool_dir, args.spool_max_batches, args.upload_timeout)
+uploader.start()
+motion_gate = create_motion_gate(args)
+
+fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
+
+update_interval = args.update_interval
+
+frame_count = 0
+last_update_time = 0
+last_results = None
+
+if not args.headless:
+    cv2.namedWindow("YOLO Parking Detection", cv2.WINDOW_NORMAL)
+    cv2.resizeWindow("YOLO Parking Detection", 1280, 720)
+
+print("Pornim analiza în timp real..." + (" (headless)" if args.headless else ""))
+
+if not args.sequential:
+    render = None if args.headless else render_frame
+    Pipeline(cap, detect_frame, render, upload_results, update_interval,
+             stats_interval=args.stats_interval, extra_stats=[uploader.stats] + ([motion_gate] if motion_gate else [])).run()
+else:
+    while True:
+        ret, frame = cap.read()
+        if not ret or frame is None:
+            print("Eroare la citirea frame-ului, retry...")
+            time.sleep(0.5)
+            ret, frame = cap.read()
+            if not ret or frame is None:
+                print("Nu am putut citi frame după retry.")
+                break
+
+        frame_count += 1
+        current_time = time.time()
+
+        if current_time - last_update_time >= update_interval or not (last_results and last_results["detections"]):
+            last_update_time = current_time
+            new_results = detect_frame(frame)
+            if new_results is not None:
+                last_results = new_results
+                upload_results(last_results)
+
+        render_frame(frame, last_results)
+
+        key = cv2.waitKey(int(1000 / fps)) & 0xFF
+        if key in [ord('q'), 27]:
+            print("Oprire manuală...")
+            break
 
 cap.release()
-cv2.destroyAllWindows()
+uploader.close()
+if motion_gate is not None:
+    print(motion_gate.summary())
+if not args.headless:
+    cv2.destroyAllWindows()
 print("Analiza finalizată.")
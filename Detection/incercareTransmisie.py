@@ -1,19 +1,23 @@
-import os
+import argparse
+import json
 import torch
 import cv2
 import time
-import requests
 from ultralytics import YOLO
-from torchvision.ops import nms
-from typing import Dict, Any, List
+from typing import Dict, Any, Optional
 import numpy
+from detectie_roi import crop_roi, detect_rois_batched
+from detectie_pipeline import Pipeline
+from detectie_config import add_common_arguments, create_motion_gate, parse_args, resolve_model_path
+from detectie_upload import ResultUploader
 
 API_BASE_URL = "http://56.228.19.103:8000"
 
+# roi = (x1, y1, x2, y2) ca fractiuni din frame-ul camerei
 PARKING_CONFIG = {
-    "P1": {"parking_number": "100000058", "window_name": "Parking Spot 1 (Upper-Right)"},
-    "P2": {"parking_number": "100000081", "window_name": "Parking Spot 2 (Lower-Left)"},
-    "P3": {"parking_number": "100000088", "window_name": "Parking Spot 3 (Lower-Right)"},
+    "P1": {"parking_number": "100000058", "window_name": "Parking Spot 1 (Upper-Right)", "roi": (0.5, 0.0, 1.0, 0.5)},
+    "P2": {"parking_number": "100000081", "window_name": "Parking Spot 2 (Lower-Left)", "roi": (0.0, 0.5, 0.5, 1.0)},
+    "P3": {"parking_number": "100000088", "window_name": "Parking Spot 3 (Lower-Right)", "roi": (0.5, 0.5, 1.0, 1.0)},
 }
 
 runs_folder = "C:/Unihack2025/ObDetector/venv/runs/detect"
@@ -25,44 +29,37 @@ TARGET_DISPLAY_WIDTH = 960
 TARGET_DISPLAY_HEIGHT = 720
 DETECTION_RESOLUTION = 1280
 
-train_folders = [f for f in os.listdir(runs_folder) if f.startswith("train")]
-train_folders.sort()
-if not train_folders:
-    raise ValueError(f"Niciun folder 'train' găsit în {runs_folder}")
-
-last_train = train_folders[-1]
-model_path = os.path.join(runs_folder, last_train, "weights", "best.pt")
-if not os.path.isfile(model_path):
-    raise FileNotFoundError(f"Modelul {model_path} nu există!")
-
+# Valorile de mai sus sunt doar implicite; pe edge box-uri se dau prin --config sau argumente
+parser = argparse.ArgumentParser(description="Detectie live pentru mai multe parcari vazute de aceeasi camera")
+add_common_arguments(parser, {
+    "api_base_url": API_BASE_URL,
+    "runs_folder": runs_folder,
+    "camera_index": CAMERA_INDEX,
+    "fallback_video": fallback_video_path,
+})
+parser.add_argument("--parking-config", type=json.loads, default=PARKING_CONFIG,
+                    help='JSON: {"P1": {"parking_number": "...", "window_name": "...", "roi": [x1, y1, x2, y2]}, ...}')
+parser.add_argument("--detection-resolution", type=int, default=DETECTION_RESOLUTION)
+args = parse_args(parser)
+
+API_BASE_URL = args.api_base_url
+PARKING_CONFIG = args.parking_config
+CAMERA_INDEX = args.camera_index
+fallback_video_path = args.fallback_video
+DETECTION_RESOLUTION = args.detection_resolution
+
+model_path = resolve_model_path(args)
 print(f"Foloseste modelul: {model_path}")
 
 model = YOLO(model_path)
 print(model.names)
 
-def simplify_class_name(name: str) -> str:
-    name = name.lower()
-    if "empty" in name:
-        return "empty"
-    elif "occupied" in name:
-        return "occupied"
-    return name
-
-def send_to_api(parking_number: str, free_count: int, occupied_count: int):
-    total_spots = free_count + occupied_count
-    payload = {
+def build_detection_payload(parking_number: str, free_count: int, occupied_count: int) -> Dict[str, int]:
+    return {
         "parking_number": int(parking_number),
         "free_spots": free_count,
-        "total_spots": total_spots
+        "total_spots": free_count + occupied_count
     }
-    try:
-        response = requests.post(f"{API_BASE_URL}/api/detection", json=payload, timeout=5)
-        if response.status_code == 200:
-            print(f"Date trimise pentru Parking ID {parking_number}: {payload}")
-        else:
-            print(f"Eroare API ({response.status_code}) pentru {parking_number}: {response.text}")
-    except Exception as e:
-        print(f"Eroare conexiune API pentru {parking_number}: {e}")
 
 def open_camera_source():
     print(f"Deschid camera la index {CAMERA_INDEX}...")
@@ -82,71 +79,9 @@ def open_camera_source():
     print("Folosesc fallback video.")
     return cv2.VideoCapture(fallback_video_path)
 
-def process_and_display_parking(frame_crop: Any, parking_id: str, is_update_time: bool) -> Dict[str, Any]:
-    global last_results
-
-    current_results = last_results.get(
-        parking_id,
-        {"free_count": 0, "occupied_count": 0, "detections": []}
-    )
-
+def display_parking(frame_crop: Any, parking_id: str, current_results: Dict[str, Any]):
     h_orig, w_orig = frame_crop.shape[:2]
 
-    detection_w = DETECTION_RESOLUTION
-    detection_h = int(h_orig * (DETECTION_RESOLUTION / w_orig))
-
-    frame_for_detection = cv2.resize(frame_crop, (detection_w, detection_h), interpolation=cv2.INTER_AREA)
-
-    if is_update_time:
-        print(f"YOLO pentru {parking_id}...")
-
-        results = model.predict(source=frame_for_detection, conf=0.3, verbose=False)
-
-        free_count = occupied_count = 0
-        detections = []
-
-        scale_x = w_orig / detection_w
-        scale_y = h_orig / detection_h
-
-        for r in results:
-            boxes = r.boxes.xyxy.cpu()
-            scores = r.boxes.conf.cpu()
-            classes = r.boxes.cls.cpu()
-
-            keep = nms(boxes, scores, iou_threshold=0.4)
-            boxes = boxes[keep]
-            scores = scores[keep]
-            classes = classes[keep]
-
-            for box, score, cls in zip(boxes, scores, classes):
-                simple = simplify_class_name(model.names[int(cls)])
-
-                x1, y1, x2, y2 = (box * torch.tensor([scale_x, scale_y, scale_x, scale_y])).int().tolist()
-
-                detections.append({
-                    "box": (x1, y1, x2, y2),
-                    "score": float(score),
-                    "label": f"{simple} {float(score):.2f}",
-                    "simple_name": simple
-                })
-
-                if simple == "empty":
-                    free_count += 1
-                elif simple == "occupied":
-                    occupied_count += 1
-
-        send_to_api(PARKING_CONFIG[parking_id]["parking_number"], free_count, occupied_count)
-
-        current_results = {
-            "free_count": free_count,
-            "occupied_count": occupied_count,
-            "detections": detections
-        }
-        last_results[parking_id] = current_results
-
-        del results
-        torch.cuda.empty_cache()
-
     info_bar_height = 90
     total_width = TARGET_DISPLAY_WIDTH
     total_height = TARGET_DISPLAY_HEIGHT + info_bar_height
@@ -183,54 +118,85 @@ def process_and_display_parking(frame_crop: Any, parking_id: str, is_update_time
 
     cv2.imshow(PARKING_CONFIG[parking_id]["window_name"], display_frame)
 
-    return current_results
+EMPTY_RESULTS = {"free_count": 0, "occupied_count": 0, "detections": []}
+
+def detect_parking(frame: Any) -> Optional[Dict[str, Dict[str, Any]]]:
+    crops = {parking_id: crop_roi(frame, config["roi"]) for parking_id, config in PARKING_CONFIG.items()}
+    # YOLO doar pe ROI-urile in care s-a miscat ceva; celelalte isi pastreaza ultimele rezultate
+    if motion_gate is not None:
+        crops = {parking_id: crop for parking_id, crop in crops.items() if motion_gate.should_infer(parking_id, crop)}
+    if not crops:
+        return None
+    print(f"YOLO pentru {', '.join(crops)}...")
+
+    # Un singur forward pass pentru toate parcarile din frame
+    start = time.perf_counter()
+    detected_results.update(detect_rois_batched(model, crops, DETECTION_RESOLUTION))
+    if motion_gate is not None:
+        motion_gate.record_inference(list(crops), time.perf_counter() - start)
+    torch.cuda.empty_cache()
+    return dict(detected_results)
+
+def upload_results(results: Dict[str, Dict[str, Any]]):
+    uploader.submit([
+        build_detection_payload(PARKING_CONFIG[parking_id]["parking_number"], r["free_count"], r["occupied_count"])
+        for parking_id, r in results.items()
+    ])
+
+def render_frame(frame: Any, results: Dict[str, Dict[str, Any]]):
+    for parking_id, config in PARKING_CONFIG.items():
+        display_parking(crop_roi(frame, config["roi"]), parking_id, (results or {}).get(parking_id, EMPTY_RESULTS))
 
 cap = open_camera_source()
 if not cap.isOpened():
     raise ValueError("Nu s-a putut deschide nicio sursă video.")
 
+uploader = ResultUploader(API_BASE_URL, args.spool_dir, args.spool_max_batches, args.upload_timeout)
+uploader.start()
+motion_gate = create_motion_gate(args)
+detected_results = {}
+
 fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
-update_interval = 1
+update_interval = args.update_interval
 last_update_time = 0
-
-last_results = {
-    "P1": {"free_count": 0, "occupied_count": 0, "detections": []},
-    "P2": {"free_count": 0, "occupied_count": 0, "detections": []},
-    "P3": {"free_count": 0, "occupied_count": 0, "detections": []},
-}
-
-cv2.namedWindow(PARKING_CONFIG["P1"]["window_name"], cv2.WINDOW_NORMAL)
-cv2.namedWindow(PARKING_CONFIG["P2"]["window_name"], cv2.WINDOW_NORMAL)
-cv2.namedWindow(PARKING_CONFIG["P3"]["window_name"], cv2.WINDOW_NORMAL)
-
-print("Pornim analiza în timp real...")
-
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("Eroare frame.")
-        break
-
-    h, w = frame.shape[:2]
-    current_time = time.time()
-
-    feed1 = frame[0:int(h/2), int(w/2):w]
-    feed2 = frame[int(h/2):h, 0:int(w/2)]
-    feed3 = frame[int(h/2):h, int(w/2):w]
-
-    is_update_time = (current_time - last_update_time >= update_interval)
-    if is_update_time:
-        last_update_time = current_time
-
-    process_and_display_parking(feed1, "P1", is_update_time)
-    process_and_display_parking(feed2, "P2", is_update_time)
-    process_and_display_parking(feed3, "P3", is_update_time)
-
-    key = cv2.waitKey(int(1000/fps)) & 0xFF
-    if key in [ord('q'), 27]:
-        print("Stop.")
-        break
+last_results = {}
+
+if not args.headless:
+    for config in PARKING_CONFIG.values():
+        cv2.namedWindow(config["window_name"], cv2.WINDOW_NORMAL)
+
+print("Pornim analiza în timp real..." + (" (headless)" if args.headless else ""))
+
+if not args.sequential:
+    render = None if args.headless else render_frame
+    Pipeline(cap, detect_parking, render, upload_results, update_interval,
+             stats_interval=args.stats_interval, extra_stats=[uploader.stats] + ([motion_gate] if motion_gate else [])).run()
+else:
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            print("Eroare frame.")
+            break
+
+        current_time = time.time()
+        if current_time - last_update_time >= update_interval:
+            last_update_time = current_time
+            new_results = detect_parking(frame)
+            if new_results is not None:
+                last_results = new_results
+                upload_results(last_results)
+
+        render_frame(frame, last_results)
+
+        key = cv2.waitKey(int(1000/fps)) & 0xFF
+        if key in [ord('q'), 27]:
+            print("Stop.")
+            break
 
 cap.release()
-cv2.destroyAllWindows()
+uploader.close()
+if motion_gate is not None:
+    print(motion_gate.summary())
+if not args.headless:
+    cv2.destroyAllWindows()
 print("Analiza finalizata.")